@@ -5,16 +5,19 @@ FastAPI应用主入口
 """
 
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 
-from ..utils.config import Config
+from ..utils.config import config
 from ..utils.exceptions import setup_exception_handlers
 from .middleware.cors import add_cors_middleware
+from .responses import ORJSONResponse
 
 logger = logging.getLogger(__name__)
 
+# 跳过认证和日志中间件的快速通道路径（仅限无敏感信息的探针和模型列表）
+_FAST_PATHS = ("/v1/", "/v1/live", "/v1/ready", "/v1/models")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -31,6 +34,10 @@ async def lifespan(app: FastAPI):
     if not config.validate_claude_setup():
         logger.warning("Claude CLI validation failed - some features may not work")
 
+    # 启动Claude进程空闲清理任务
+    from ..services.claude_service import get_claude_service
+    get_claude_service().start()
+
     logger.info("Claude OpenAI API Wrapper startup completed")
 
     yield
@@ -44,10 +51,8 @@ async def lifespan(app: FastAPI):
         from ..services.session_manager import stop_session_manager
         await stop_session_manager()
 
-        # 清理Claude进程
-        from ..services.claude_service import get_claude_service
-        claude_service = get_claude_service()
-        await claude_service.cleanup_all_processes()
+        # 停止清理任务并清理Claude进程
+        await get_claude_service().stop()
 
         logger.info("Graceful shutdown completed")
     except Exception as e:
@@ -65,25 +70,31 @@ def create_app() -> FastAPI:
         description="完全兼容OpenAI格式的Claude API封装服务",
         version="1.0.0",
         lifespan=lifespan,
+        default_response_class=ORJSONResponse,
         docs_url="/docs",
         redoc_url="/redoc",
         openapi_url="/openapi.json"
     )
 
-    # 添加CORS中间件
-    add_cors_middleware(app)
+    # 中间件按添加顺序由内向外包裹，最后添加的最先执行
+    # 添加响应压缩中间件（最内层）
+    from .middleware.compression import add_compression_middleware
+    add_compression_middleware(app)
+
+    # 添加请求响应日志中间件（调试用，位于认证之内，不记录被拒绝的请求）
+    from .middleware.request_logging import add_request_logging_middleware
+    add_request_logging_middleware(app)
 
     # 添加API Key验证中间件
     from .middleware.api_key_auth import APIKeyAuthMiddleware
     app.add_middleware(APIKeyAuthMiddleware)
 
-    # 添加请求响应日志中间件（调试用）
-    from .middleware.request_logging import add_request_logging_middleware
-    add_request_logging_middleware(app)
+    # 添加请求大小限制中间件（在认证之外，超限请求不会被读取）
+    from .middleware.validation import add_validation_middleware
+    add_validation_middleware(app)
 
-    # 添加验证中间件 (暂时禁用以测试核心功能)
-    # from .middleware.validation import add_validation_middleware
-    # add_validation_middleware(app)
+    # 添加CORS中间件（最后添加，位于最外层，预检请求不经过认证等中间件）
+    add_cors_middleware(app)
 
     # 添加异常处理器
     setup_exception_handlers(app)
@@ -100,6 +111,22 @@ def create_app() -> FastAPI:
     from .routes.health import router as health_router
     app.include_router(health_router, prefix="/v1")
 
+    # 添加快速通道：健康检查和模型列表由精简应用直接处理，跳过认证和日志中间件
+    from .routes.chat import list_models
+    from .middleware.fast_path import add_fast_path_middleware
+    fast_app = FastAPI(
+        default_response_class=ORJSONResponse,
+        docs_url=None,
+        redoc_url=None,
+        openapi_url=None
+    )
+    add_cors_middleware(fast_app)
+    setup_exception_handlers(fast_app)
+    fast_app.include_router(health_router, prefix="/v1")
+    fast_app.add_api_route("/v1/models", list_models, methods=["GET"])
+    # 只有探针端点走快速通道；/v1/detailed会暴露会话和配置信息，必须经过认证
+    add_fast_path_middleware(app, fast_app, _FAST_PATHS)
+
     return app
 
 
@@ -110,12 +137,26 @@ app = create_app()
 if __name__ == "__main__":
     import uvicorn
 
-    config = Config()
+    # uvloop不支持Windows，不可用时回退到默认asyncio事件循环
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+
+    # httptools未安装时回退到h11解析器
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "h11"
 
     uvicorn.run(
         "src.api.main:app",
         host=config.host,
         port=config.port,
         reload=config.debug,
-        log_level=config.log_level.lower()
+        log_level=config.log_level.lower(),
+        loop=loop,
+        http=http
     )
\ No newline at end of file
@@ -4,170 +4,357 @@ API Key验证中间件
 在API请求处理之前验证API Key并进行频率限制检查。
 """
 
+import asyncio
+import functools
+import hashlib
 import json
-from typing import Optional
-from fastapi import Request, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+import time
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from urllib.parse import parse_qsl
+import orjson
+from fastapi import Request, Response, status
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import logging
 
-from ...services.api_key_service import api_key_service
 from ...utils.config import config
-from ...models.api_key import OpenAIErrorResponse
+
+if TYPE_CHECKING:
+    from ...models.api_key import OpenAIErrorResponse
+    from ...services.api_key_service import APIKeyService
 
 logger = logging.getLogger(__name__)
 
-# HTTP Bearer认证方案
-security = HTTPBearer(auto_error=False)
+# API Key验证结果缓存：key摘要 -> (过期时间, 错误响应)
+# 只缓存无效Key和频率限制的拒绝结果（服务内部错误不缓存），有效Key的每次请求都需要经过服务计数，不能缓存
+_VALIDATION_CACHE_MAXSIZE = 10_000
+_VALIDATION_CACHE_TTL = 300.0
+_validation_cache: Dict[bytes, Tuple[float, "OpenAIErrorResponse"]] = {}
+# 缓存内容对应的API Key配置版本，配置重新加载后整体清空，修正后的Key立即生效
+_validation_cache_generation = 0
+
+# 正在进行的验证：key摘要 -> 验证结果Future，并发的相同Key请求等待同一次验证
+_in_flight: Dict[bytes, "asyncio.Future[Optional[OpenAIErrorResponse]]"] = {}
+
+# 不计入API Key使用次数的路径：查询统计本身不应改变统计结果，否则ETag永远无法命中
+_UNCOUNTED_PATHS = frozenset({"/v1/api-key/stats"})
+
+# 只有小于该长度的请求体才会被读取以查找API Key，大请求直接返回401
+_BODY_API_KEY_MAX_LENGTH = 4096
+
+
+def _api_key_digest(api_key: str) -> bytes:
+    """计算API Key的缓存键（不保存明文）"""
+    return hashlib.blake2b(api_key.encode("utf-8"), digest_size=16).digest()
 
 
-class APIKeyAuthMiddleware(BaseHTTPMiddleware):
-    """API Key验证中间件"""
+@functools.cache
+def _get_service() -> "APIKeyService":
+    """首次验证时才导入API Key服务，只检查应用结构的工具不会加载它"""
+    from ...services.api_key_service import api_key_service
+    return api_key_service
 
-    # 不需要验证的路径
-    EXCLUDED_PATHS = {
-        "/health",
+
+def invalidate(api_key: str) -> None:
+    """清除指定API Key的验证结果缓存"""
+    _validation_cache.pop(_api_key_digest(api_key), None)
+
+
+@functools.lru_cache(maxsize=32)
+def _serialize_error(
+    message: str,
+    error_type: str,
+    code: str,
+    retry_after: Optional[int] = None
+) -> bytes:
+    """序列化错误响应体，认证错误种类很少，结果可直接复用"""
+    error: Dict[str, object] = {
+        "message": message,
+        "type": error_type,
+        "code": code
+    }
+    if retry_after:
+        error["retry_after"] = retry_after
+    return orjson.dumps({"error": error})
+
+
+# 固定消息的错误响应：错误类型 -> (状态码, 模块加载时序列化好的响应体)
+_STATIC_RESPONSES: Dict[str, Tuple[int, bytes]] = {
+    "missing_api_key": (
+        status.HTTP_401_UNAUTHORIZED,
+        orjson.dumps({"error": {
+            "message": "API Key required",
+            "type": "missing_api_key",
+            "code": "missing_api_key"
+        }})
+    ),
+    "internal_error": (
+        status.HTTP_500_INTERNAL_SERVER_ERROR,
+        orjson.dumps({"error": {
+            "message": "Internal server error during API key validation",
+            "type": "internal_error",
+            "code": "internal_error"
+        }})
+    ),
+}
+
+
+class APIKeyAuthMiddleware:
+    """API Key验证中间件（纯ASGI实现，避免BaseHTTPMiddleware的额外任务开销）"""
+
+    # 不需要验证的路径（健康检查和模型列表由快速通道处理，不会到达这里）
+    EXCLUDED_PATHS = frozenset({
         "/docs",
         "/redoc",
         "/openapi.json",
         "/favicon.ico",
         "/",
-        "/v1/models",
-        "/models",
-    }
+    })
 
-    def __init__(self, app):
-        super().__init__(app)
+    # 不需要验证的路径前缀（str.startswith接受元组，一次调用完成匹配）
+    _EXCLUDED_PREFIXES = ("/static/", "/assets/")
 
-    async def dispatch(self, request: Request, call_next):
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # 运行期间不会修改，避免每次请求读取配置属性
+        self.api_key_enabled = config.api_key_enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """中间件处理逻辑"""
-        path = request.url.path
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        # 检查是否为排除路径
-        if path in self.EXCLUDED_PATHS or path.startswith("/static"):
-            return await call_next(request)
+        path = scope["path"]
 
-        # 如果未启用API Key验证，直接通过
-        if not config.api_key_enabled:
-            return await call_next(request)
+        # 检查是否为排除路径；如果未启用API Key验证，直接通过
+        if (
+            path in self.EXCLUDED_PATHS
+            or path.startswith(self._EXCLUDED_PREFIXES)
+            or not self.api_key_enabled
+        ):
+            await self.app(scope, receive, send)
+            return
 
         try:
-            # 提取API Key
-            api_key = await self._extract_api_key(request)
+            # 提取API Key（读取过请求体时返回可重放的receive）
+            api_key, receive = await self._extract_api_key(scope, receive)
 
             if api_key is None:
-                return self._create_error_response(
+                response = self._create_error_response(
                     message="API Key required",
                     error_type="missing_api_key",
                     status_code=status.HTTP_401_UNAUTHORIZED
                 )
-
-            # 验证API Key
-            is_valid, error_response = await api_key_service.validate_api_key(api_key)
-
-            if not is_valid:
-                return self._create_openai_error_response(error_response)
-
-            # 将API Key信息添加到请求状态中
-            request.state.api_key = api_key
-
-            return await call_next(request)
+            else:
+                # 验证API Key
+                error_response = await self._validate_api_key(api_key, path not in _UNCOUNTED_PATHS)
+                response = None if error_response is None else self._create_openai_error_response(error_response)
 
         except Exception as e:
             logger.error(f"API Key验证过程中发生错误: {e}")
-            return self._create_error_response(
+            response = self._create_error_response(
                 message="Internal server error during API key validation",
                 error_type="internal_error",
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    async def _extract_api_key(self, request: Request) -> Optional[str]:
+        if response is not None:
+            await response(scope, receive, send)
+            return
+
+        # 将API Key信息添加到请求状态中（request.state读取的就是scope["state"]）
+        scope.setdefault("state", {})["api_key"] = api_key
+
+        await self.app(scope, receive, send)
+
+    async def _validate_api_key(self, api_key: str, record: bool = True) -> Optional["OpenAIErrorResponse"]:
+        """验证API Key，返回错误响应；最近被拒绝的Key直接命中缓存，record为False时不计入使用次数"""
+        global _validation_cache_generation
+        digest = _api_key_digest(api_key)
+        now = time.monotonic()
+
+        generation = config.api_key_generation
+        if generation != _validation_cache_generation:
+            _validation_cache.clear()
+            _validation_cache_generation = generation
+
+        cached = _validation_cache.get(digest)
+        if cached is not None:
+            expires_at, error_response = cached
+            if now < expires_at:
+                return error_response
+            del _validation_cache[digest]
+
+        in_flight = _in_flight.get(digest)
+        if in_flight is not None:
+            # 已有相同Key的验证在进行：拒绝结果可直接复用；
+            # 验证通过时每个请求都要单独计数，仍需自己调用服务
+            try:
+                error_response = await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                # 发起验证的请求被取消（如客户端断开）时自行验证
+                if not in_flight.cancelled():
+                    raise
+                error_response = None
+            if error_response is not None:
+                return error_response
+            return await self._call_service(digest, api_key, record)
+
+        future = asyncio.get_running_loop().create_future()
+        _in_flight[digest] = future
+        try:
+            error_response = await self._call_service(digest, api_key, record)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待者时避免"exception was never retrieved"警告
+            future.exception()
+            raise
+        else:
+            future.set_result(error_response)
+            return error_response
+        finally:
+            _in_flight.pop(digest, None)
+
+    async def _call_service(self, digest: bytes, api_key: str, record: bool = True) -> Optional["OpenAIErrorResponse"]:
+        """调用服务验证API Key并计数，拒绝结果写入缓存；服务内部错误直接抛出，不会被缓存"""
+        generation = config.api_key_generation
+        is_valid, error_response = await _get_service().validate_api_key(api_key, record)
+        if is_valid:
+            return None
+
+        if generation != config.api_key_generation:
+            # 验证期间配置已重新加载，旧配置下的拒绝结果不再缓存
+            return error_response
+
+        now = time.monotonic()
+
+        # 频率限制的拒绝结果不能缓存到周期结束之后
+        ttl = _VALIDATION_CACHE_TTL
+        retry_after = error_response.error.get("retry_after")
+        if retry_after:
+            ttl = min(ttl, retry_after)
+
+        if len(_validation_cache) >= _VALIDATION_CACHE_MAXSIZE:
+            # 淘汰最早写入的条目
+            del _validation_cache[next(iter(_validation_cache))]
+        _validation_cache[digest] = (now + ttl, error_response)
+
+        return error_response
+
+    async def _extract_api_key(self, scope: Scope, receive: Receive) -> Tuple[Optional[str], Receive]:
         """从请求中提取API Key"""
         # 1. 首先尝试从Authorization header中获取
-        authorization: str = request.headers.get("Authorization")
-        if authorization:
-            try:
-                scheme, credentials = authorization.split(" ", 1)
-                if scheme.lower() == "bearer":
-                    return credentials
-            except ValueError:
-                # Header格式不正确
-                pass
+        content_length = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                try:
+                    scheme, credentials = value.decode("latin-1").split(" ", 1)
+                    if scheme.lower() == "bearer":
+                        return credentials, receive
+                except ValueError:
+                    # Header格式不正确
+                    pass
+            elif name == b"content-length":
+                content_length = value
 
         # 2. 尝试从查询参数中获取 (OpenAI格式)
-        api_key = request.query_params.get("api_key")
-        if api_key:
-            return api_key
-
-        # 3. 尝试从请求体中获取 (仅对POST/PUT请求)
-        if request.method in ("POST", "PUT", "PATCH"):
-            try:
-                # 读取请求体
-                body = await request.body()
-                if body:
+        query_string = scope.get("query_string", b"")
+        if query_string:
+            api_key = dict(parse_qsl(query_string.decode("latin-1"))).get("api_key")
+            if api_key:
+                return api_key, receive
+
+        # 3. 尝试从请求体中获取 (仅对POST/PUT请求，且请求体长度已知并足够小)
+        if scope["method"] in ("POST", "PUT", "PATCH") and self._is_small_body(content_length):
+            body, receive = await self._read_body(receive)
+            if b'"api_key"' in body:
+                try:
                     body_data = json.loads(body.decode("utf-8"))
-                    if "api_key" in body_data:
-                        return body_data["api_key"]
-            except (json.JSONDecodeError, UnicodeDecodeError):
-                # 无法解析请求体，忽略
-                pass
+                    if isinstance(body_data, dict) and "api_key" in body_data:
+                        return body_data["api_key"], receive
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # 无法解析请求体，忽略
+                    pass
+
+        return None, receive
+
+    @staticmethod
+    def _is_small_body(content_length: Optional[bytes]) -> bool:
+        """根据Content-Length判断请求体是否小到值得解析"""
+        if content_length is None:
+            return False
+        try:
+            return int(content_length) < _BODY_API_KEY_MAX_LENGTH
+        except ValueError:
+            return False
 
-        return None
+    @staticmethod
+    async def _read_body(receive: Receive) -> Tuple[bytes, Receive]:
+        """读取完整请求体，并返回可将已读消息重放给下游的receive"""
+        messages: list[Message] = []
+        body = bytearray()
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+
+        async def replay_receive() -> Message:
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        return bytes(body), replay_receive
 
     def _create_error_response(
         self,
         message: str,
         error_type: str,
         status_code: int = status.HTTP_401_UNAUTHORIZED
-    ) -> JSONResponse:
-        """创建标准错误响应"""
-        error_response = {
-            "error": {
-                "message": message,
-                "type": error_type,
-                "code": error_type
-            }
-        }
-
-        return JSONResponse(
-            content=error_response,
-            status_code=status_code,
-            headers={"Content-Type": "application/json"}
+    ) -> Response:
+        """创建标准错误响应，固定消息的错误类型直接使用预先序列化的响应体"""
+        static_response = _STATIC_RESPONSES.get(error_type)
+        if static_response is not None:
+            status_code, body = static_response
+        else:
+            body = _serialize_error(message, error_type, error_type)
+
+        return Response(
+            content=body,
+            media_type="application/json",
+            status_code=status_code
         )
 
     def _create_openai_error_response(
         self,
-        openai_error: OpenAIErrorResponse,
+        openai_error: "OpenAIErrorResponse",
         status_code: int = status.HTTP_401_UNAUTHORIZED
-    ) -> JSONResponse:
+    ) -> Response:
         """创建OpenAI格式的错误响应"""
-        return JSONResponse(
-            content=openai_error.model_dump(),
-            status_code=status_code,
-            headers={"Content-Type": "application/json"}
+        error = openai_error.error
+        return Response(
+            content=_serialize_error(
+                error["message"],
+                error["type"],
+                error["code"],
+                error.get("retry_after")
+            ),
+            media_type="application/json",
+            status_code=status_code
         )
 
 
-class APIKeyDependency:
-    """API Key依赖注入"""
-
-    @staticmethod
-    async def verify_api_key(request: Request) -> Optional[str]:
-        """验证API Key的依赖函数"""
-        if not config.api_key_enabled:
-            return None
-
-        # 从中间件设置的状态中获取API Key
-        api_key = getattr(request.state, "api_key", None)
-        if api_key is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="API Key required"
-            )
-
-        return api_key
-
+async def get_api_key(request: Request) -> Optional[str]:
+    """
+    获取中间件已验证的API Key
 
-# 创建依赖实例
-api_key_dependency = APIKeyDependency()
\ No newline at end of file
+    启用验证时中间件已拒绝缺少或无效Key的请求，这里只读取其写入的状态；
+    未启用验证时返回None。保持为async函数，FastAPI不会把它放到线程池执行。
+    """
+    return request.scope.get("state", {}).get("api_key")
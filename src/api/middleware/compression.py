@@ -0,0 +1,28 @@
+"""
+响应压缩中间件模块
+
+对较大的JSON响应进行GZip压缩，流式响应（text/event-stream）由GZipMiddleware自动跳过。
+"""
+
+from fastapi import FastAPI
+from starlette.middleware.gzip import GZipMiddleware
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 小于该大小的响应不压缩（字节）
+GZIP_MINIMUM_SIZE = 1024
+GZIP_COMPRESS_LEVEL = 5
+
+
+def add_compression_middleware(app: FastAPI) -> None:
+    """添加响应压缩中间件到FastAPI应用（需在认证中间件之前添加，使认证位于外层）"""
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=GZIP_MINIMUM_SIZE,
+        compresslevel=GZIP_COMPRESS_LEVEL,
+    )
+    logger.info("Compression middleware configured", extra={
+        "minimum_size": GZIP_MINIMUM_SIZE,
+        "compresslevel": GZIP_COMPRESS_LEVEL
+    })
@@ -4,68 +4,80 @@ CORS中间件模块
 处理跨域资源共享。
 """
 
-from typing import List
+from typing import Tuple
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
+from ...utils.config import config
+
 logger = logging.getLogger(__name__)
 
+# 默认允许的源
+_DEFAULT_ALLOWED_ORIGINS: Tuple[str, ...] = (
+    "http://localhost:3000",  # React开发服务器
+    "http://localhost:8080",  # Vue开发服务器
+    "http://localhost:8000",  # 其他开发服务器
+    "http://127.0.0.1:3000",
+    "http://127.0.0.1:8080",
+    "http://127.0.0.1:8000",
+)
 
-def add_cors_middleware(app: FastAPI) -> None:
-    """添加CORS中间件到FastAPI应用"""
+# 允许的源（可通过CORS_ORIGINS环境变量覆盖，导入时读取一次）
+_ALLOWED_ORIGINS: Tuple[str, ...] = tuple(
+    origin.strip() for origin in (config.cors_origins or "").split(",") if origin.strip()
+) or _DEFAULT_ALLOWED_ORIGINS
+
+# 允许的方法
+_ALLOWED_METHODS: Tuple[str, ...] = (
+    "GET",
+    "POST",
+    "PUT",
+    "DELETE",
+    "OPTIONS",
+    "PATCH"
+)
 
-    # 允许的源
-    allowed_origins: List[str] = [
-        "http://localhost:3000",  # React开发服务器
-        "http://localhost:8080",  # Vue开发服务器
-        "http://localhost:8000",  # 其他开发服务器
-        "http://127.0.0.1:3000",
-        "http://127.0.0.1:8080",
-        "http://127.0.0.1:8000",
-    ]
+# 允许的头部
+_ALLOWED_HEADERS: Tuple[str, ...] = (
+    "accept",
+    "accept-language",
+    "content-language",
+    "content-type",
+    "authorization",
+    "x-requested-with",
+    "openai-organization",
+    "openai-project"
+)
 
-    # 允许的方法
-    allowed_methods: List[str] = [
-        "GET",
-        "POST",
-        "PUT",
-        "DELETE",
-        "OPTIONS",
-        "PATCH"
-    ]
+# 暴露的头部
+_EXPOSE_HEADERS: Tuple[str, ...] = (
+    "x-request-id",
+    "x-ratelimit-limit",
+    "x-ratelimit-remaining"
+)
 
-    # 允许的头部
-    allowed_headers: List[str] = [
-        "accept",
-        "accept-language",
-        "content-language",
-        "content-type",
-        "authorization",
-        "x-requested-with",
-        "openai-organization",
-        "openai-project"
-    ]
+_LOG_EXTRA = {
+    "allowed_origins": _ALLOWED_ORIGINS,
+    "allowed_methods": _ALLOWED_METHODS,
+    "allowed_headers": _ALLOWED_HEADERS
+}
 
-    # 暴露的头部
-    expose_headers: List[str] = [
-        "x-request-id",
-        "x-ratelimit-limit",
-        "x-ratelimit-remaining"
-    ]
 
+def add_cors_middleware(app: FastAPI) -> None:
+    """
+    添加CORS中间件到FastAPI应用
+
+    需在其他中间件之后添加，使其位于最外层，预检请求不经过认证等中间件。
+    """
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=allowed_origins,
+        allow_origins=_ALLOWED_ORIGINS,
         allow_credentials=True,
-        allow_methods=allowed_methods,
-        allow_headers=allowed_headers,
-        expose_headers=expose_headers,
+        allow_methods=_ALLOWED_METHODS,
+        allow_headers=_ALLOWED_HEADERS,
+        expose_headers=_EXPOSE_HEADERS,
         max_age=600,  # 预检请求缓存时间（秒）
     )
 
-    logger.info("CORS middleware configured", extra={
-        "allowed_origins": allowed_origins,
-        "allowed_methods": allowed_methods,
-        "allowed_headers": allowed_headers
-    })
\ No newline at end of file
+    logger.info("CORS middleware configured", extra=_LOG_EXTRA)
@@ -0,0 +1,35 @@
+"""
+快速通道中间件模块
+
+将健康检查、模型列表等轻量端点直接分发到精简应用，跳过认证和日志中间件栈。
+"""
+
+from typing import Iterable
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Receive, Scope, Send
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FastPathMiddleware:
+    """快速通道分发中间件（纯ASGI实现）"""
+
+    def __init__(self, app: ASGIApp, fast_app: ASGIApp, paths: Iterable[str]):
+        self.app = app
+        self.fast_app = fast_app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"] in self.paths:
+            await self.fast_app(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+
+def add_fast_path_middleware(app: FastAPI, fast_app: FastAPI, paths: Iterable[str]) -> None:
+    """添加快速通道中间件到FastAPI应用（需最后添加，使其位于最外层）"""
+    paths = sorted(paths)
+    app.add_middleware(FastPathMiddleware, fast_app=fast_app, paths=paths)
+    logger.info("Fast path middleware configured", extra={"paths": paths})
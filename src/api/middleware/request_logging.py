@@ -1,164 +1,185 @@
 """
 请求响应日志中间件
 
-将HTTP请求和响应包打印到命令行，用于调试。
+在DEBUG日志级别下记录HTTP请求和响应包，用于调试。
 """
 
+import atexit
 import json
-import time
-from typing import Callable
-from fastapi import Request, Response
-from fastapi.responses import StreamingResponse
 import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ...utils.config import config
 
 logger = logging.getLogger(__name__)
 
+# 流式数据块日志的合并阈值：累计字节数或距上次输出的时间（秒）
+_STREAM_LOG_FLUSH_SIZE = 4096
+_STREAM_LOG_FLUSH_INTERVAL = 0.01
+
+# 日志中隐藏值的请求头（ASGI请求头名均为小写字节串）
+_SENSITIVE_HEADERS = frozenset({b"authorization", b"cookie", b"x-api-key", b"x-api-token"})
+
+
+class _ForwardHandler(logging.Handler):
+    """在后台线程中将日志记录交回本模块日志器，按正常的日志器层级输出"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logger.handle(record)
+
+
+# 中间件写日志用的私有日志器：不注册到日志器层级中，只负责把记录放入队列，
+# 不需要修改任何共享日志器的propagate设置
+_queue_logger = logging.Logger(__name__)
+
+
+def _setup_queue_logging() -> None:
+    """中间件日志改由后台线程输出，避免在事件循环中阻塞写终端"""
+    if _queue_logger.handlers:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, _ForwardHandler())
+    _queue_logger.addHandler(QueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
+
+
+def _format_body(body: bytes) -> str:
+    """格式化请求/响应体，JSON内容缩进输出"""
+    if not body:
+        return "(空)"
+
+    body_str = body.decode("utf-8", errors="ignore")
+    try:
+        return json.dumps(json.loads(body_str), indent=2, ensure_ascii=False)
+    except json.JSONDecodeError:
+        return body_str[:1000] + ("..." if len(body_str) > 1000 else "")
+
+
+class RequestLoggingMiddleware:
+    """记录HTTP请求和响应的中间件（纯ASGI实现，不消费请求体）"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not logger.isEnabledFor(logging.DEBUG):
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.time()
+        method = scope["method"]
+        url = scope["path"]
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+
+        request_headers = scope["headers"]
+        log_stream_chunks = (b"x-debug-stream", b"1") in request_headers
+        request_body = bytearray()
+        response_body = bytearray()
+        stream_log_buffer = bytearray()
+        stream_log_flushed_at = start_time
+        is_streaming = False
+
+        def flush_stream_log() -> None:
+            nonlocal stream_log_flushed_at
+            if stream_log_buffer:
+                _queue_logger.debug(f"  📄 数据块: {stream_log_buffer.decode('utf-8', errors='ignore').strip()}")
+                stream_log_buffer.clear()
+            stream_log_flushed_at = time.time()
+
+        async def logged_receive() -> Message:
+            # 旁路记录下游读取的请求体，而不是提前读取
+            message = await receive()
+            if message["type"] == "http.request":
+                request_body.extend(message.get("body", b""))
+            return message
+
+        async def logged_send(message: Message) -> None:
+            nonlocal is_streaming
+            if message["type"] == "http.response.start":
+                response_headers = message.get("headers", [])
+                content_type = dict(response_headers).get(b"content-type", b"")
+                is_streaming = content_type.startswith(b"text/event-stream")
+
+                lines = [
+                    "=" * 80,
+                    f"🔵 HTTP请求 [{method}] {url}",
+                    "=" * 80,
+                    "📋 请求头:",
+                ]
+                for name, value in request_headers:
+                    # 隐藏敏感信息
+                    if name in _SENSITIVE_HEADERS:
+                        value = b"***HIDDEN***"
+                    lines.append(f"  {name.decode('latin-1')}: {value.decode('latin-1')}")
+                if method in ("POST", "PUT", "PATCH"):
+                    lines.append("📦 请求体:")
+                    lines.append(_format_body(bytes(request_body)))
+
+                lines.extend([
+                    "-" * 80,
+                    f"🟢 HTTP响应 [{message['status']}] - 耗时: {time.time() - start_time:.3f}s",
+                    "-" * 80,
+                    "📋 响应头:",
+                ])
+                for name, value in response_headers:
+                    lines.append(f"  {name.decode('latin-1')}: {value.decode('latin-1')}")
+                if is_streaming:
+                    lines.append("📦 响应体: (流式响应)")
+                _queue_logger.debug("\n".join(lines))
+
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                if is_streaming:
+                    # 流式响应默认不记录数据块，请求头带X-Debug-Stream: 1时才记录，
+                    # 小数据块合并后按大小或时间间隔输出
+                    more_body = message.get("more_body", False)
+                    if log_stream_chunks:
+                        stream_log_buffer.extend(body)
+                        if (
+                            not more_body
+                            or len(stream_log_buffer) >= _STREAM_LOG_FLUSH_SIZE
+                            or time.time() - stream_log_flushed_at >= _STREAM_LOG_FLUSH_INTERVAL
+                        ):
+                            flush_stream_log()
+                    if not more_body:
+                        _queue_logger.debug("✅ 流式响应结束")
+                else:
+                    response_body.extend(body)
+                    if not message.get("more_body", False):
+                        _queue_logger.debug(f"📦 响应体:\n{_format_body(bytes(response_body))}\n{'=' * 80}")
+
+            await send(message)
 
-async def log_requests_middleware(request: Request, call_next: Callable) -> Response:
-    """
-    记录HTTP请求和响应的中间件
-    
-    Args:
-        request: FastAPI请求对象
-        call_next: 下一个中间件或路由处理器
-        
-    Returns:
-        Response: 响应对象
-    """
-    start_time = time.time()
-    
-    # 打印请求信息
-    print("\n" + "="*80)
-    print(f"🔵 HTTP请求 [{request.method}] {request.url}")
-    print("="*80)
-    
-    # 打印请求头
-    print("📋 请求头:")
-    for name, value in request.headers.items():
-        # 隐藏敏感信息
-        if name.lower() in ['authorization', 'cookie', 'x-api-key']:
-            value = "***HIDDEN***"
-        print(f"  {name}: {value}")
-    
-    # 打印查询参数
-    if request.query_params:
-        print("🔍 查询参数:")
-        for key, value in request.query_params.items():
-            print(f"  {key}: {value}")
-    
-    # 读取并打印请求体（使用更安全的方式）
-    request_body_logged = False
-    if request.method in ["POST", "PUT", "PATCH"]:
         try:
-            # 使用form()或json()方法，这些方法会正确处理请求体
-            content_type = request.headers.get("content-type", "")
-            
-            if "application/json" in content_type:
-                try:
-                    json_data = await request.json()
-                    print("📦 请求体 (JSON):")
-                    print(json.dumps(json_data, indent=2, ensure_ascii=False))
-                    request_body_logged = True
-                except Exception:
-                    pass
-            
-            if not request_body_logged:
-                # 对于其他类型的请求体，尝试读取原始数据
-                try:
-                    body_bytes = await request.body()
-                    if body_bytes:
-                        body_str = body_bytes.decode('utf-8', errors='ignore')
-                        print("📦 请求体:")
-                        print(body_str[:1000] + ("..." if len(body_str) > 1000 else ""))
-                    else:
-                        print("📦 请求体: (空)")
-                except Exception as e:
-                    print(f"📦 请求体读取失败: {e}")
-                    
+            await self.app(scope, logged_receive, logged_send)
         except Exception as e:
-            print(f"📦 请求体处理失败: {e}")
-    
-    # 不再修改request对象的内部方法
-    
-    # 调用下一个处理器
-    try:
-        response = await call_next(request)
-        
-        # 计算处理时间
-        process_time = time.time() - start_time
-        
-        # 打印响应信息
-        print("\n" + "-"*80)
-        print(f"🟢 HTTP响应 [{response.status_code}] - 耗时: {process_time:.3f}s")
-        print("-"*80)
-        
-        # 打印响应头
-        print("📋 响应头:")
-        for name, value in response.headers.items():
-            print(f"  {name}: {value}")
-        
-        # 处理响应体
-        if isinstance(response, StreamingResponse):
-            print("📦 响应体: (流式响应)")
-            
-            # 包装流式响应以记录内容
-            original_body_iterator = response.body_iterator
-            
-            async def logged_body_iterator():
-                print("🔄 流式响应内容:")
-                async for chunk in original_body_iterator:
-                    if isinstance(chunk, bytes):
-                        chunk_str = chunk.decode('utf-8', errors='ignore')
-                        print(f"  📄 数据块: {chunk_str.strip()}")
-                    yield chunk
-                print("✅ 流式响应结束")
-            
-            response.body_iterator = logged_body_iterator()
-            
-        else:
-            # 对于普通响应，尝试读取响应体
-            if hasattr(response, 'body') and response.body:
-                try:
-                    body_str = response.body.decode('utf-8')
-                    print("📦 响应体:")
-                    try:
-                        # 尝试格式化JSON
-                        json_data = json.loads(body_str)
-                        print(json.dumps(json_data, indent=2, ensure_ascii=False))
-                    except json.JSONDecodeError:
-                        # 如果不是JSON，直接打印
-                        print(body_str)
-                except Exception as e:
-                    print(f"📦 响应体读取失败: {e}")
-            else:
-                print("📦 响应体: (空)")
-        
-        print("="*80 + "\n")
-        
-        return response
-        
-    except Exception as e:
-        # 处理异常
-        process_time = time.time() - start_time
-        print("\n" + "-"*80)
-        print(f"🔴 HTTP异常 - 耗时: {process_time:.3f}s")
-        print("-"*80)
-        print(f"❌ 异常类型: {type(e).__name__}")
-        print(f"❌ 异常信息: {str(e)}")
-        
-        # 记录到日志系统
-        logger.error(f"请求处理异常: {request.method} {request.url} - {str(e)}", exc_info=True)
-        
-        print("="*80 + "\n")
-        raise
-
-
-def add_request_logging_middleware(app):
+            # 记录到日志系统
+            process_time = time.time() - start_time
+            _queue_logger.error(
+                f"请求处理异常: {method} {url} - {str(e)} (耗时: {process_time:.3f}s)",
+                exc_info=True
+            )
+            raise
+
+
+def add_request_logging_middleware(app) -> None:
     """
     添加请求日志中间件到FastAPI应用
-    
+
+    仅在调试模式或DEBUG日志级别下添加中间件并启动日志线程，其余情况不增加任何开销。
+
     Args:
         app: FastAPI应用实例
     """
-    app.middleware("http")(log_requests_middleware)
-    print("✅ 请求响应日志中间件已启用 - 所有HTTP请求和响应将打印到命令行")
\ No newline at end of file
+    if not (config.debug or config.log_level.upper() == "DEBUG" or logger.isEnabledFor(logging.DEBUG)):
+        return
+
+    _setup_queue_logging()
+    app.add_middleware(RequestLoggingMiddleware)
+    logger.info("Request logging middleware configured")
@@ -4,24 +4,38 @@ API Key统计和管理路由
 提供API Key使用情况查询和统计功能。
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import hashlib
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from typing import Dict, Any, Optional
 import logging
 
 from ...services.api_key_service import api_key_service
 from ...utils.config import config
-from ...models.api_key import OpenAIErrorResponse
-from ..middleware.api_key_auth import api_key_dependency
+from ...utils.batching import BatchingLoader
+from ..middleware.api_key_auth import get_api_key, invalidate
+from ..responses import ORJSONResponse
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["API Key管理"])
 
+# 合并同一时间窗口内的统计查询，仪表盘并发轮询时只访问一次服务
+usage_stats_loader: BatchingLoader[str, Dict[str, Any]] = BatchingLoader(
+    api_key_service.get_usage_stats_bulk
+)
 
-@router.get("/api-key/stats", summary="获取API Key使用统计")
+
+@router.get(
+    "/api-key/stats",
+    summary="获取API Key使用统计",
+    response_class=ORJSONResponse,
+    response_model=None
+)
 async def get_api_key_stats(
-    api_key: Optional[str] = Depends(api_key_dependency.verify_api_key)
-) -> Dict[str, Any]:
+    request: Request,
+    api_key: Optional[str] = Depends(get_api_key)
+) -> Response:
     """
     获取当前API Key的使用统计信息
 
@@ -40,14 +54,22 @@ async def get_api_key_stats(
         )
 
     try:
-        stats = await api_key_service.get_usage_stats(api_key)
+        stats = await usage_stats_loader.load(api_key)
         if stats is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="API Key not found"
             )
 
-        return stats
+        # 统计未变化时返回304，轮询的仪表盘无需重复下载
+        body = orjson.dumps(stats, option=orjson.OPT_NON_STR_KEYS)
+        etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=5"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        return Response(content=body, media_type="application/json", headers=headers)
 
     except Exception as e:
         logger.error(f"获取API Key统计失败: {e}")
@@ -57,10 +79,15 @@ async def get_api_key_stats(
         )
 
 
-@router.get("/api-key/admin/stats", summary="获取所有API Key统计信息")
+@router.get(
+    "/api-key/admin/stats",
+    summary="获取所有API Key统计信息",
+    response_class=ORJSONResponse,
+    response_model=None
+)
 async def get_all_api_key_stats(
-    api_key: Optional[str] = Depends(api_key_dependency.verify_api_key)
-) -> Dict[str, Any]:
+    api_key: Optional[str] = Depends(get_api_key)
+) -> ORJSONResponse:
     """
     获取所有API Key的统计信息（管理功能）
 
@@ -73,7 +100,7 @@ async def get_all_api_key_stats(
         )
 
     try:
-        return api_key_service.get_all_stats()
+        return ORJSONResponse(api_key_service.get_all_stats())
 
     except Exception as e:
         logger.error(f"获取所有API Key统计失败: {e}")
@@ -86,7 +113,7 @@ async def get_all_api_key_stats(
 @router.post("/api-key/admin/reset", summary="重置API Key使用记录")
 async def reset_api_key_usage(
     api_key_to_reset: str,
-    api_key: Optional[str] = Depends(api_key_dependency.verify_api_key)
+    api_key: Optional[str] = Depends(get_api_key)
 ) -> Dict[str, Any]:
     """
     重置指定API Key的使用记录（管理功能）
@@ -101,6 +128,7 @@ async def reset_api_key_usage(
 
     try:
         success = await api_key_service.reset_usage(api_key_to_reset)
+        invalidate(api_key_to_reset)
 
         return {
             "success": success,
@@ -4,24 +4,35 @@
 实现OpenAI兼容的/v1/chat/completions端点。
 """
 
-import uuid
-import json
-from datetime import datetime
-from typing import Union
-from fastapi import APIRouter, HTTPException, Depends
+import inspect
+import itertools
+import secrets
+import asyncio
+from weakref import WeakValueDictionary
+from typing import Any, Awaitable, Callable, Coroutine, Optional, Set, Union
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import StreamingResponse
+from pydantic import ValidationError as PydanticValidationError
+from starlette.types import Receive, Scope, Send
 import logging
 
-from ...models.message import ChatCompletionRequest
+from ...models.message import (
+    ChatCompletionRequest,
+    ChatMessage,
+    chat_completion_request_adapter,
+    chat_completion_request_schema
+)
 from ...models.response import (
     ChatCompletionResponse,
+    DEFAULT_MODELS_JSON,
     ErrorResponse,
     ModelsResponse
 )
 from ...services.claude_service import get_claude_service, ClaudeProcess
 from ...services.stream_service import get_stream_service
 from ...services.session_manager import get_session_manager
-from ...models.session import SessionCreateRequest, SessionUpdateRequest
+from ...models.session import Session, SessionCreateRequest, SessionUpdateRequest
 from ...utils.exceptions import ClaudeAPIError, ValidationError
 from ...utils.config import config
 
@@ -30,9 +41,148 @@ logger = logging.getLogger(__name__)
 # 创建路由器
 router = APIRouter(tags=["chat"])
 
+# 响应ID由进程启动时的随机标签和进程内递增计数组成，无需每个请求生成UUID
+_BOOT_TAG = secrets.token_hex(4)
+_REQ_COUNTER = itertools.count()
+
+# 流式错误事件模板，出错时只替换错误消息
+_STREAM_ERROR_TEMPLATE = ErrorResponse.create(message="", error_type="streaming_error").model_dump()
+
+# 会话ID -> 会话锁；没有请求持有时锁会被自动回收
+_session_locks: "WeakValueDictionary[str, asyncio.Lock]" = WeakValueDictionary()
+
+# 正在执行的后台会话写入任务，保持强引用避免任务被回收
+_background_tasks: "Set[asyncio.Task[Any]]" = set()
+
+
+class _SessionStreamingResponse(StreamingResponse):
+    """流式响应：发送结束后关闭生成器并执行收尾回调，客户端在开始发送前断开时同样执行"""
+
+    def __init__(self, content: Any, on_close: Callable[[], None], **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                self.on_close()
+
+
+def _spawn_background(coro: Coroutine[Any, Any, Any], response_id: str) -> "asyncio.Task[Any]":
+    """在后台执行不影响响应内容的收尾工作，出错时只记录日志"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
 
-@router.post("/chat/completions", response_model=None)
-async def chat_completions(request: ChatCompletionRequest) -> Union[ChatCompletionResponse, StreamingResponse]:
+    def _on_done(task: "asyncio.Task[Any]") -> None:
+        _background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background session update failed: {task.exception()}", extra={
+                "response_id": response_id
+            })
+
+    task.add_done_callback(_on_done)
+    return task
+
+
+async def _finalize_session(
+    session: Session,
+    claude_process: ClaudeProcess,
+    pending_message: Optional[Awaitable[Any]] = None
+) -> None:
+    """完成请求后的会话写入：等待用户消息保存，并记录Claude返回的session ID"""
+    if pending_message is not None:
+        await pending_message
+
+    claude_session_id = claude_process.get_claude_session_id()
+    if claude_session_id and claude_session_id != session.claude_session_id:
+        await get_session_manager().update_session(
+            session_id=session.session_id,
+            request=SessionUpdateRequest(claude_session_id=claude_session_id)
+        )
+        logger.info(f"Updated session with Claude session ID", extra={
+            "session_id": session.session_id,
+            "claude_session_id": claude_session_id
+        })
+
+
+def _finalize_session_in_background(
+    session: Session,
+    claude_process: ClaudeProcess,
+    session_lock: asyncio.Lock,
+    response_id: str,
+    pending_message: Optional[Awaitable[Any]] = None
+) -> None:
+    """
+    在后台完成会话写入，结束后释放调用方持有的会话锁
+
+    写入完成后才释放锁，保证同一会话的下一个请求读到最新的session ID；
+    锁在任务的完成回调中释放，任务在开始执行前就被取消时也不会一直占用会话。
+    """
+    try:
+        task = _spawn_background(
+            _finalize_session(session, claude_process, pending_message),
+            response_id
+        )
+    except BaseException:
+        session_lock.release()
+        raise
+
+    def _on_done(task: "asyncio.Task[Any]") -> None:
+        session_lock.release()
+        # 任务未开始就被取消时关闭尚未执行的保存协程，避免"never awaited"警告
+        if task.cancelled() and inspect.iscoroutine(pending_message):
+            pending_message.close()
+
+    task.add_done_callback(_on_done)
+
+
+async def _ensure_running_process(claude_process: ClaudeProcess) -> ClaudeProcess:
+    """
+    确认进程仍由服务管理
+
+    获取进程后的等待期间（保存用户消息、等待响应开始）进程可能已被缓存淘汰或空闲清理停止，
+    此时按原配置重新获取，避免send_message报错或启动无人管理的CLI。
+    返回后到send_message获取进程锁之间没有await，进程不会再被淘汰。
+    """
+    if claude_process.is_running:
+        return claude_process
+    return await get_claude_service().get_or_create_process(
+        session_id=claude_process.config.session_id,
+        working_dir=claude_process.config.working_dir,
+        continue_session=claude_process.config.continue_session
+    )
+
+
+async def parse_chat_completion_request(http_request: Request) -> ChatCompletionRequest:
+    """直接从原始请求体验证聊天请求，验证失败时按FastAPI的请求验证错误处理"""
+    body = await http_request.body()
+    try:
+        return chat_completion_request_adapter.validate_json(body)
+    except PydanticValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)],
+            body=body
+        )
+
+
+@router.post(
+    "/chat/completions",
+    response_model=None,
+    # 请求体由parse_chat_completion_request解析，需手动声明文档中的请求体结构
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/json": {"schema": chat_completion_request_schema()}},
+            "required": True
+        }
+    }
+)
+async def chat_completions(
+    request: ChatCompletionRequest = Depends(parse_chat_completion_request)
+) -> Union[ChatCompletionResponse, StreamingResponse]:
     """
     创建聊天完成
 
@@ -45,7 +195,7 @@ async def chat_completions(request: ChatCompletionRequest) -> Union[ChatCompleti
             raise ValidationError("Messages cannot be empty")
 
         # 生成响应ID
-        response_id = f"chatcmpl-{uuid.uuid4().hex[:8]}-{int(datetime.now().timestamp())}"
+        response_id = f"chatcmpl-{_BOOT_TAG}{next(_REQ_COUNTER):08x}"
 
         logger.info(f"Chat completion request received", extra={
             "response_id": response_id,
@@ -55,6 +205,9 @@ async def chat_completions(request: ChatCompletionRequest) -> Union[ChatCompleti
             "session_id": request.get_session_id()
         })
 
+        # 解析后的Claude工作目录
+        working_dir = config.claude_working_dir_str
+
         # 获取最后一条用户消息
         last_user_message = request.get_last_user_message()
         if not last_user_message:
@@ -70,7 +223,7 @@ async def chat_completions(request: ChatCompletionRequest) -> Union[ChatCompleti
             # 更新现有会话或获取会话
             session = await session_manager.get_or_create_session(
                 session_id=session_id,
-                claude_working_dir=str(config.claude_working_path) if config.claude_working_path is not None else None
+                claude_working_dir=working_dir
             )
             logger.debug(f"Using existing session", extra={
                 "session_id": session_id,
@@ -80,7 +233,7 @@ async def chat_completions(request: ChatCompletionRequest) -> Union[ChatCompleti
             # 为新请求创建临时会话
             session = await session_manager.create_session(
                 SessionCreateRequest(
-                    claude_working_dir=str(config.claude_working_path) if config.claude_working_path is not None else None
+                    claude_working_dir=working_dir
                 )
             )
             session_id = session.session_id
@@ -88,66 +241,80 @@ async def chat_completions(request: ChatCompletionRequest) -> Union[ChatCompleti
                 "session_id": session_id
             })
 
-        # 添加用户消息到会话
-        await session_manager.add_message_to_session(
-            session_id=session_id,
-            message=last_user_message
-        )
-
-        # 创建Claude进程
-        # 对于新会话，不传递session_id，让Claude创建新的会话ID
-        # 对于现有会话，传递Claude返回的session_id
-        claude_session_id = session.claude_session_id if session.claude_session_id else None
-        
-        logger.debug(f"Creating Claude process", extra={
-            "session_id": session_id,
-            "claude_session_id": claude_session_id,
-            "continue_session": bool(claude_session_id)
-        })
-
-        # 使用get_or_create_process支持进程重用
-        claude_process = await claude_service.get_or_create_process(
-            session_id=claude_session_id,
-            working_dir=str(config.claude_working_path) if config.claude_working_path is not None else None,
-            continue_session=bool(claude_session_id)
-        )
+        # 同一会话的请求串行处理，不同会话之间互不影响
+        session_lock = _session_locks.setdefault(session_id, asyncio.Lock())
+        await session_lock.acquire()
+        release_lock = True
+        try:
+            # 创建Claude进程
+            # 对于新会话，不传递session_id，让Claude创建新的会话ID
+            # 对于现有会话，传递Claude返回的session_id
+            claude_session_id = session.claude_session_id if session.claude_session_id else None
+
+            logger.debug(f"Creating Claude process", extra={
+                "session_id": session_id,
+                "claude_session_id": claude_session_id,
+                "continue_session": bool(claude_session_id)
+            })
 
-        # 转换消息为Claude格式
-        claude_prompt = request.to_claude_prompt()
-        logger.debug(f"Converted to Claude prompt", extra={
-            "response_id": response_id,
-            "prompt_length": len(claude_prompt)
-        })
+            # 使用get_or_create_process支持进程重用
+            process_task = asyncio.create_task(claude_service.get_or_create_process(
+                session_id=claude_session_id,
+                working_dir=working_dir,
+                continue_session=bool(claude_session_id)
+            ))
+
+            if not request.stream:
+                # 进程初始化与保存用户消息互不依赖，并发执行；
+                # 流式响应在发送首个数据块后才保存用户消息
+                try:
+                    await session_manager.add_message_to_session(
+                        session_id=session_id,
+                        message=last_user_message
+                    )
+                except BaseException:
+                    process_task.cancel()
+                    raise
+
+            claude_process = await process_task
+
+            # 转换消息为Claude格式
+            claude_prompt = request.to_claude_prompt()
+            logger.debug(f"Converted to Claude prompt", extra={
+                "response_id": response_id,
+                "prompt_length": len(claude_prompt)
+            })
 
-        if request.stream:
-            # 流式响应
-            response = await _handle_streaming_response(
-                response_id,
-                claude_process,
-                claude_prompt,
-                request.model
-            )
-        else:
-            # 非流式响应
-            response = await _handle_non_streaming_response(
-                response_id,
-                claude_process,
-                claude_prompt,
-                request.model
-            )
+            if request.stream:
+                # 流式响应（会话锁交给响应对象，响应结束后保存会话并释放）
+                response = await _handle_streaming_response(
+                    response_id,
+                    claude_process,
+                    claude_prompt,
+                    request.model,
+                    session_lock,
+                    session,
+                    last_user_message
+                )
+                release_lock = False
+            else:
+                # 保存用户消息期间进程可能已被缓存淘汰
+                claude_process = await _ensure_running_process(claude_process)
+
+                # 非流式响应
+                response = await _handle_non_streaming_response(
+                    response_id,
+                    claude_process,
+                    claude_prompt,
+                    request.model
+                )
 
-        # 更新会话信息，保存Claude返回的session ID
-        claude_session_id = claude_process.get_claude_session_id()
-        if claude_session_id and claude_session_id != session.claude_session_id:
-            update_request = SessionUpdateRequest(claude_session_id=claude_session_id)
-            await session_manager.update_session(
-                session_id=session_id,
-                request=update_request
-            )
-            logger.info(f"Updated session with Claude session ID", extra={
-                "session_id": session_id,
-                "claude_session_id": claude_session_id
-            })
+                # 在后台保存Claude返回的session ID，完成后释放会话锁
+                _finalize_session_in_background(session, claude_process, session_lock, response_id)
+                release_lock = False
+        finally:
+            if release_lock:
+                session_lock.release()
 
         return response
 
@@ -178,38 +345,94 @@ async def _handle_streaming_response(
     response_id: str,
     claude_process: ClaudeProcess,
     claude_prompt: str,
-    model: str
+    model: str,
+    session_lock: asyncio.Lock,
+    session: Session,
+    user_message: ChatMessage
 ) -> StreamingResponse:
-    """处理流式响应"""
+    """
+    处理流式响应
+
+    调用方已持有会话锁，锁随响应对象一起交出，从路由到生成结束一直持有；
+    首个数据块发送后才在后台保存用户消息，响应结束（包括客户端在开始发送前断开）后
+    由后台任务保存用户消息和Claude返回的session ID并释放会话锁。
+    """
     try:
         stream_service = get_stream_service()
+        batch_size = config.stream_batch_size
+        message_task: Optional["asyncio.Task[Any]"] = None
+
+        def save_user_message() -> Awaitable[Any]:
+            return get_session_manager().add_message_to_session(
+                session_id=session.session_id,
+                message=user_message
+            )
+
+        def finalize() -> None:
+            # 未发送过数据块时用户消息尚未开始保存，交给收尾任务一并处理
+            _finalize_session_in_background(
+                session,
+                claude_process,
+                session_lock,
+                response_id,
+                message_task if message_task is not None else save_user_message()
+            )
 
         async def generate():
             """生成流式响应"""
-            try:
-                # 发送消息到Claude并获取流式输出
-                claude_output = claude_process.send_message(claude_prompt)
+            nonlocal message_task, claude_process
+            batch = []
 
-                # 转换为OpenAI格式的SSE流
-                async for sse_data in stream_service.create_claude_stream(
+            # 响应开始前进程可能已被缓存淘汰或空闲清理停止
+            claude_process = await _ensure_running_process(claude_process)
+
+            # 发送消息到Claude并获取流式输出
+            claude_output = claude_process.send_message(claude_prompt)
+            try:
+                if not inspect.isasyncgen(claude_output):
+                    # 同步迭代器会让每个数据块都经过线程池，拖慢流式输出
+                    logger.warning("Claude output is not an async generator", extra={
+                        "response_id": response_id,
+                        "output_type": type(claude_output).__name__
+                    })
+
+                # 转换为OpenAI格式的SSE流，按配置合并多条事件后一次发送
+                async for chunk in stream_service.create_claude_stream(
                     response_id=response_id,
                     claude_output=claude_output,
                     model=model
                 ):
-                    yield sse_data
+                    batch.append(stream_service._format_sse_data(chunk))
+                    if len(batch) >= batch_size:
+                        yield b"".join(batch)
+                        batch.clear()
+                        if message_task is None:
+                            message_task = asyncio.create_task(save_user_message())
+
+                if batch:
+                    yield b"".join(batch)
 
             except Exception as e:
                 logger.error(f"Error in streaming response generation: {e}", extra={
                     "response_id": response_id
                 })
+                # 先发送已合并但未发送的事件
+                if batch:
+                    yield b"".join(batch)
                 # 发送错误响应
-                yield stream_service._format_sse_data(ErrorResponse.create(
-                    message=str(e),
-                    error_type="streaming_error"
-                ).dict())
+                yield stream_service._format_sse_data({
+                    **_STREAM_ERROR_TEMPLATE,
+                    "error": {**_STREAM_ERROR_TEMPLATE["error"], "message": str(e)}
+                })
+            finally:
+                # 客户端中途断开时立即结束Claude回合，释放会话锁前进程已空闲
+                if inspect.isasyncgen(claude_output):
+                    await claude_output.aclose()
 
-        return StreamingResponse(
+        # 直接返回响应对象时FastAPI不会补充SSE响应头，需要显式设置
+        return _SessionStreamingResponse(
             generate(),
+            on_close=finalize,
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache",
@@ -236,16 +459,12 @@ async def _handle_non_streaming_response(
         stream_service = get_stream_service()
 
         # 发送消息到Claude并收集完整响应
-        response_json = await stream_service.create_non_streaming_response(
+        return await stream_service.create_non_streaming_response_obj(
             response_id=response_id,
             claude_output=claude_process.send_message(claude_prompt),
             model=model
         )
 
-        # 解析JSON并返回响应对象
-        response_dict = json.loads(response_json)
-        return ChatCompletionResponse(**response_dict)
-
     except Exception as e:
         logger.error(f"Error in non-streaming response generation: {e}", extra={
             "response_id": response_id
@@ -253,25 +472,15 @@ async def _handle_non_streaming_response(
         raise ClaudeAPIError(f"Failed to generate response: {e}")
 
 
-@router.get("/models")
-async def list_models() -> ModelsResponse:
+@router.get("/models", response_model=ModelsResponse)
+async def list_models() -> Response:
     """
     列出可用模型
 
-    返回支持的模型列表。
+    返回支持的模型列表（预先序列化的响应体）。
     """
-    try:
-        logger.info("Models list requested")
-
-        # 返回支持的Claude模型
-        return ModelsResponse.create_default()
-
-    except Exception as e:
-        logger.error(f"Error listing models: {e}")
-        raise HTTPException(status_code=500, detail=ErrorResponse.create(
-            message="Failed to list models",
-            error_type="internal_server_error"
-        ).model_dump())
+    logger.info("Models list requested")
+    return Response(content=DEFAULT_MODELS_JSON, media_type="application/json")
 
 
 # 导出路由器
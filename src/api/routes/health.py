@@ -4,9 +4,13 @@
 提供健康检查和系统状态监控端点。
 """
 
+import asyncio
+import functools
+import os
+import time
 from datetime import datetime
-from typing import Dict, Any
-from fastapi import APIRouter, HTTPException
+from typing import Dict, Any, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Response
 import logging
 
 from ...models.response import HealthResponse
@@ -19,6 +23,37 @@ logger = logging.getLogger(__name__)
 # 创建路由器
 router = APIRouter(tags=["health"])
 
+# Claude CLI检查结果缓存时间（秒），避免每次探针都启动子进程
+CLAUDE_CHECK_TTL = 5.0
+_claude_check: Optional[Tuple[float, bool]] = None
+
+
+@functools.lru_cache(maxsize=1)
+def _iso_timestamp(second: int) -> str:
+    """格式化秒级时间戳，同一秒内的探针复用同一字符串"""
+    return datetime.fromtimestamp(second).isoformat()
+
+
+def _iso_now() -> str:
+    """当前时间的ISO格式字符串（秒级精度）"""
+    return _iso_timestamp(int(time.time()))
+
+
+# 存活检查响应体模板，只需填入时间戳
+_LIVE_BODY_TEMPLATE = b'{"alive":true,"timestamp":"%%s","pid":%d}' % os.getpid()
+
+
+async def cached_validate_claude_setup() -> bool:
+    """检查Claude CLI可用性，结果在CLAUDE_CHECK_TTL秒内复用"""
+    global _claude_check
+    now = time.monotonic()
+    if _claude_check is not None and now - _claude_check[0] < CLAUDE_CHECK_TTL:
+        return _claude_check[1]
+
+    available = await asyncio.to_thread(config.validate_claude_setup)
+    _claude_check = (time.monotonic(), available)
+    return available
+
 
 @router.get("/")
 async def health_check() -> HealthResponse:
@@ -32,7 +67,7 @@ async def health_check() -> HealthResponse:
         claude_service = get_claude_service()
 
         # 检查Claude CLI可用性
-        claude_available = config.validate_claude_setup()
+        claude_available = await cached_validate_claude_setup()
 
         # 获取系统状态
         active_sessions = session_manager.get_active_session_count()
@@ -41,7 +76,7 @@ async def health_check() -> HealthResponse:
 
         return HealthResponse(
             status="healthy" if claude_available else "degraded",
-            timestamp=datetime.now().isoformat(),
+            timestamp=_iso_now(),
             version="1.0.0",
             active_sessions=active_sessions
         )
@@ -50,7 +85,7 @@ async def health_check() -> HealthResponse:
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=503, detail={
             "status": "unhealthy",
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _iso_now(),
             "error": str(e)
         })
 
@@ -66,16 +101,21 @@ async def detailed_health_check() -> Dict[str, Any]:
         session_manager = get_session_manager()
         claude_service = get_claude_service()
 
+        # Claude CLI检查（子进程）与活跃会话查询互不依赖，并发执行
+        claude_available, active_sessions = await asyncio.gather(
+            cached_validate_claude_setup(),
+            session_manager.get_active_sessions()
+        )
+
         # Claude CLI状态
         claude_status = {
-            "available": config.validate_claude_setup(),
+            "available": claude_available,
             "command": config.claude_command,
-            "working_dir": str(config.claude_working_path) if config.claude_working_path else None
+            "working_dir": config.claude_working_dir_str
         }
 
         # 会话统计
         session_stats = session_manager.get_stats()
-        active_sessions = await session_manager.get_active_sessions()
 
         session_status = {
             "total_active": len(active_sessions),
@@ -86,17 +126,24 @@ async def detailed_health_check() -> Dict[str, Any]:
         }
 
         if active_sessions:
-            oldest = min(active_sessions, key=lambda s: s.created_at)
-            newest = max(active_sessions, key=lambda s: s.created_at)
+            # 一次遍历同时找出最早和最新的会话
+            oldest = newest = active_sessions[0]
+            for session in active_sessions:
+                if session.created_at < oldest.created_at:
+                    oldest = session
+                elif session.created_at > newest.created_at:
+                    newest = session
+
+            now = datetime.now()
             session_status["oldest_session"] = {
                 "id": oldest.session_id,
                 "created_at": oldest.created_at.isoformat(),
-                "age_seconds": oldest.get_session_age().total_seconds()
+                "age_seconds": (now - oldest.created_at).total_seconds()
             }
             session_status["newest_session"] = {
                 "id": newest.session_id,
                 "created_at": newest.created_at.isoformat(),
-                "age_seconds": newest.get_session_age().total_seconds()
+                "age_seconds": (now - newest.created_at).total_seconds()
             }
 
         # Claude进程状态
@@ -129,7 +176,7 @@ async def detailed_health_check() -> Dict[str, Any]:
 
         return {
             "status": overall_status,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _iso_now(),
             "version": "1.0.0",
             "components": {
                 "claude_cli": claude_status,
@@ -148,7 +195,7 @@ async def detailed_health_check() -> Dict[str, Any]:
         logger.error(f"Detailed health check failed: {e}")
         return {
             "status": "unhealthy",
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _iso_now(),
             "error": str(e),
             "components": {}
         }
@@ -166,7 +213,7 @@ async def readiness_check() -> Dict[str, Any]:
         session_manager = get_session_manager()
         claude_service = get_claude_service()
 
-        claude_ready = config.validate_claude_setup()
+        claude_ready = await cached_validate_claude_setup()
         sessions_ready = session_manager.get_session_count() >= 0  # 基本检查
         processes_ready = True  # Claude service总是就绪的
 
@@ -174,7 +221,7 @@ async def readiness_check() -> Dict[str, Any]:
 
         return {
             "ready": ready,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _iso_now(),
             "checks": {
                 "claude_cli": "ok" if claude_ready else "failed",
                 "session_manager": "ok" if sessions_ready else "failed",
@@ -186,23 +233,22 @@ async def readiness_check() -> Dict[str, Any]:
         logger.error(f"Readiness check failed: {e}")
         return {
             "ready": False,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _iso_now(),
             "error": str(e)
         }
 
 
-@router.get("/live")
-async def liveness_check() -> Dict[str, Any]:
+@router.get("/live", response_model=Dict[str, Any])
+async def liveness_check() -> Response:
     """
     存活检查
 
     简单的存活检查，用于确定服务是否在运行。
     """
-    return {
-        "alive": True,
-        "timestamp": datetime.now().isoformat(),
-        "pid": None  # TODO: 获取进程ID
-    }
+    return Response(
+        content=_LIVE_BODY_TEMPLATE % _iso_now().encode("ascii"),
+        media_type="application/json"
+    )
 
 
 # 导出路由器
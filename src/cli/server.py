@@ -6,12 +6,21 @@
 
 import argparse
 import asyncio
+import shutil
+import subprocess
 import sys
 import signal
 from pathlib import Path
 from typing import Optional
 import logging
 
+import uvicorn
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from ..api.main import app
 from ..utils.config import config, Config
 from ..utils.port_manager import find_available_port
@@ -74,9 +83,6 @@ def parse_arguments() -> argparse.Namespace:
 
 def validate_claude_setup(claude_dir: Optional[str] = None) -> None:
     """验证Claude CLI设置"""
-    import subprocess
-    import shutil
-
     claude_command_name = config.claude_command
     claude_command_path = shutil.which(claude_command_name)
 
@@ -103,6 +109,8 @@ def validate_claude_setup(claude_dir: Optional[str] = None) -> None:
             )
 
         logger.info(f"Claude CLI verified: {result.stdout.strip()}")
+        # 记录验证结果，健康检查在CLI未更新前不再重复启动子进程
+        config.mark_claude_verified(claude_command_path)
 
     except subprocess.TimeoutExpired:
         raise ConfigurationError(
@@ -171,27 +179,32 @@ async def start_server(
         })
 
         # 启动服务器
-        import uvicorn
-
         server_config = uvicorn.Config(
             app=app,
             host=config.host,
             port=config.port,
             reload=reload,
             log_level=config.log_level.lower(),
-            access_log=True,
+            # 访问日志每个请求都会调用logging，仅调试模式下开启
+            access_log=config.debug,
+            backlog=2048,
             use_colors=True
         )
 
         server = uvicorn.Server(server_config)
 
-        # 设置信号处理
-        def signal_handler(signum, frame):
+        # 设置信号处理：通过事件循环回调关闭，进行中的流式响应可以正常结束
+        def signal_handler(signum: int) -> None:
             logger.info(f"Received signal {signum}, shutting down...")
             server.should_exit = True
 
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, signal_handler, signum)
+            except NotImplementedError:
+                # Windows事件循环不支持add_signal_handler
+                signal.signal(signum, lambda signum, frame: signal_handler(signum))
 
         await server.serve()
 
@@ -203,6 +216,18 @@ async def start_server(
         sys.exit(1)
 
 
+def _event_loop_factory():
+    """
+    返回事件循环工厂，已安装uvloop时使用uvloop
+
+    服务器通过Server.serve()在已有事件循环中运行，uvicorn的loop配置不会生效，
+    需要在创建事件循环时选择。
+    """
+    if uvloop is None:
+        return None
+    return uvloop.new_event_loop
+
+
 def main() -> None:
     """主入口函数"""
     try:
@@ -213,13 +238,14 @@ def main() -> None:
         args = parse_arguments()
 
         # 启动服务器
-        asyncio.run(start_server(
-            host=args.host,
-            port=args.port,
-            claude_dir=args.claude_dir,
-            reload=args.reload,
-            log_level=args.log_level
-        ))
+        with asyncio.Runner(loop_factory=_event_loop_factory()) as runner:
+            runner.run(start_server(
+                host=args.host,
+                port=args.port,
+                claude_dir=args.claude_dir,
+                reload=args.reload,
+                log_level=args.log_level
+            ))
 
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
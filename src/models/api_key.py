@@ -4,10 +4,11 @@ API Key数据模型
 定义API Key相关的数据结构和验证逻辑。
 """
 
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from enum import Enum
 from typing import Optional, Dict, Any
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field
 
 
 class RateLimitPeriod(str, Enum):
@@ -18,40 +19,45 @@ class RateLimitPeriod(str, Enum):
 
 class APIKeyConfig(BaseModel):
     """API Key配置模型"""
-    key: str = Field(..., description="API密钥")
+    key: str = Field(..., min_length=8, description="API密钥（不少于8个字符）")
     max_requests: int = Field(..., gt=0, description="最大请求次数")
     period: RateLimitPeriod = Field(..., description="限制周期")
     description: Optional[str] = Field(None, description="API Key描述")
 
-    @validator('key')
-    def validate_key_format(cls, v):
-        """验证API Key格式"""
-        if not v or len(v) < 8:
-            raise ValueError("API Key长度不能少于8个字符")
-        return v
 
+@dataclass(slots=True)
+class APIKeyUsage:
+    """
+    API Key使用记录
 
-class APIKeyUsage(BaseModel):
-    """API Key使用记录"""
+    仅在服务内部使用、每个请求都会更新计数，使用slots数据类而不是Pydantic模型，
+    避免BaseModel.__setattr__的开销。
+    """
     api_key: str
-    current_period_requests: int = 0
     period_start: datetime
     period_end: datetime
+    current_period_requests: int = 0
     last_used: Optional[datetime] = None
 
-    def is_period_expired(self) -> bool:
-        """检查当前周期是否已过期"""
-        now = datetime.now(timezone.utc)
+    def is_period_expired(self, now: Optional[datetime] = None) -> bool:
+        """检查当前周期是否已过期（now由调用方传入时复用同一时间戳）"""
+        if now is None:
+            now = datetime.now(timezone.utc)
         return now > self.period_end
 
     def can_make_request(self, max_requests: int) -> bool:
         """检查是否可以发起请求"""
         return self.current_period_requests < max_requests
 
-    def record_request(self) -> None:
-        """记录一次请求"""
+    def record_request(self, now: Optional[datetime] = None) -> None:
+        """
+        记录一次请求
+
+        计数需立即生效：频率限制检查直接读取该值，延迟批量写入会在周期重置时
+        把旧周期的请求计入新周期。last_used复用验证时读取的时间戳，不单独取时间。
+        """
         self.current_period_requests += 1
-        self.last_used = datetime.now(timezone.utc)
+        self.last_used = now if now is not None else datetime.now(timezone.utc)
 
     def reset_period(self, new_start: datetime, new_end: datetime) -> None:
         """重置周期"""
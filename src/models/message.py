@@ -4,12 +4,20 @@
 定义OpenAI格式的请求和响应消息模型。
 """
 
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
-from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, List, Optional, Tuple, Union
+from pydantic import BaseModel, Field, PrivateAttr, TypeAdapter, field_validator
 from enum import Enum
+import logging
 
-from .response import MessageRole, Usage
+from .response import MessageRole
+
+logger = logging.getLogger(__name__)
+
+# Claude提示中各角色的前缀，非用户消息都按助手消息处理
+_ROLE_PREFIX = {
+    MessageRole.USER: "Human: ",
+    MessageRole.ASSISTANT: "Assistant: ",
+}
 
 
 class ContentType(str, Enum):
@@ -41,6 +49,9 @@ class ChatMessage(BaseModel):
     # OpenAI支持但非必需的字段
     function_call: Optional[Dict[str, Any]] = None
 
+    # 多模态内容的文本缓存：(对应的content对象, 拼接后的文本)，content被替换时失效
+    _text_cache: Optional[Tuple[Any, str]] = PrivateAttr(default=None)
+
     @field_validator('content')
     @classmethod
     def validate_content(cls, v, info):
@@ -72,15 +83,21 @@ class ChatMessage(BaseModel):
         return cls(role=MessageRole.ASSISTANT, content=content)
 
     def get_text_content(self) -> str:
-        """获取文本内容"""
-        if isinstance(self.content, str):
-            return self.content
-        elif isinstance(self.content, list):
-            text_parts = []
-            for part in self.content:
-                if part.type == ContentType.TEXT and part.text:
-                    text_parts.append(part.text)
-            return "\n".join(text_parts)
+        """获取文本内容（多模态内容的拼接结果会被缓存）"""
+        content = self.content
+        if isinstance(content, str):
+            return content
+        elif isinstance(content, list):
+            cached = self._text_cache
+            if cached is not None and cached[0] is content:
+                return cached[1]
+
+            text = "\n".join(
+                part.text for part in content
+                if part.type is ContentType.TEXT and part.text
+            )
+            self._text_cache = (content, text)
+            return text
         return ""
 
     def to_claude_format(self) -> str:
@@ -97,6 +114,7 @@ class ChatCompletionRequest(BaseModel):
     top_p: Optional[float] = Field(1.0, ge=0.0, le=1.0, description="核采样参数")
     stream: Optional[bool] = Field(False, description="是否流式响应")
     stop: Optional[Union[str, List[str]]] = Field(None, description="停止序列")
+    # pattern和max_length在模型构建时由pydantic-core编译一次，校验不经过Python回调，不要改成自定义验证器
     user: Optional[str] = Field(None, pattern="^[a-zA-Z0-9_-]+$", max_length=255, description="用户标识符")
 
     class Config:
@@ -121,17 +139,19 @@ class ChatCompletionRequest(BaseModel):
         if not v:
             raise ValueError("Messages list cannot be empty")
 
-        # 验证消息顺序
-        for i, message in enumerate(v):
+        # 验证消息顺序（角色已验证为枚举成员，可直接按身份比较）
+        system, assistant = MessageRole.SYSTEM, MessageRole.ASSISTANT
+        prev_role = None
+        for i, role in enumerate([message.role for message in v]):
             # 系统消息只能在开头
-            if message.role == MessageRole.SYSTEM and i > 0:
+            if role is system and i > 0:
                 raise ValueError("System messages must be at the beginning")
 
             # 不能连续两个助手消息（用户消息可以连续）
-            if i > 0 and message.role == MessageRole.ASSISTANT:
-                prev_role = v[i-1].role
-                if prev_role == MessageRole.ASSISTANT:
-                    raise ValueError("Consecutive assistant messages are not allowed")
+            if role is assistant and prev_role is assistant:
+                raise ValueError("Consecutive assistant messages are not allowed")
+
+            prev_role = role
 
         return v
 
@@ -167,33 +187,30 @@ class ChatCompletionRequest(BaseModel):
 
     def to_claude_prompt(self) -> str:
         """转换为Claude命令行提示格式，包含完整的对话上下文"""
-        # 构建完整的对话上下文
-        prompt_parts = []
-        
         # 添加系统消息（如果有）
         system_msg = self.get_system_message()
-        if system_msg:
-            prompt_parts.append(f"System: {system_msg.get_text_content()}")
-        
+        prompt_parts = ["System: " + system_msg.get_text_content()] if system_msg else []
+
         # 添加对话历史
         conversation_history = self.get_conversation_history()
-        for message in conversation_history:
-            role_name = "Human" if message.role == MessageRole.USER else "Assistant"
-            content = message.get_text_content()
-            prompt_parts.append(f"{role_name}: {content}")
-        
+        prompt_parts.extend(
+            _ROLE_PREFIX.get(message.role, "Assistant: ") + message.get_text_content()
+            for message in conversation_history
+        )
+
         # 组合成完整的提示
         if prompt_parts:
             # 确保最后一条是用户消息，如果不是则添加提示
             if conversation_history and conversation_history[-1].role != MessageRole.USER:
                 prompt_parts.append("Human: ")
-            
+
             result = "\n\n".join(prompt_parts)
-            print(f"🔍 to_claude_prompt生成的多轮对话内容: {repr(result[:200])}{'...' if len(result) > 200 else ''}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"to_claude_prompt生成的多轮对话内容: {result[:200]!r}{'...' if len(result) > 200 else ''}")
             return result
-        
+
         # 如果没有任何消息，返回空字符串
-        print("⚠️ 没有找到任何消息")
+        logger.debug("没有找到任何消息")
         return ""
 
 
@@ -227,9 +244,38 @@ class ModelUsage(BaseModel):
     total_tokens: int = 0
 
     def add(self, other: "ModelUsage") -> "ModelUsage":
-        """合并使用信息"""
-        return ModelUsage(
+        """合并使用信息，返回新对象（两个加数都已验证，跳过字段验证）"""
+        return ModelUsage.model_construct(
             prompt_tokens=self.prompt_tokens + other.prompt_tokens,
             completion_tokens=self.completion_tokens + other.completion_tokens,
             total_tokens=self.total_tokens + other.total_tokens
-        )
\ No newline at end of file
+        )
+
+    def iadd(self, other: "ModelUsage") -> "ModelUsage":
+        """原地累加使用信息，逐块汇总流式用量时无需每次创建新对象"""
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.total_tokens += other.total_tokens
+        return self
+
+
+# 预先构建的聊天请求验证器，可直接从原始JSON字节验证，省去json.loads生成的中间字典
+chat_completion_request_adapter: TypeAdapter[ChatCompletionRequest] = TypeAdapter(ChatCompletionRequest)
+
+
+def chat_completion_request_schema() -> Dict[str, Any]:
+    """生成内联了所有引用的聊天请求JSON Schema，供不经过FastAPI解析请求体的路由生成接口文档"""
+    schema = chat_completion_request_adapter.json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def resolve(node: Any) -> Any:
+        if isinstance(node, dict):
+            resolved = {key: resolve(value) for key, value in node.items() if key != "$ref"}
+            if "$ref" in node:
+                return {**resolve(definitions[node["$ref"].rsplit("/", 1)[-1]]), **resolved}
+            return resolved
+        if isinstance(node, list):
+            return [resolve(item) for item in node]
+        return node
+
+    return resolve(schema)
@@ -2,10 +2,14 @@
 API响应模型模块
 
 定义OpenAI兼容的响应格式。
+
+响应模型只由服务端代码构造，create等工厂方法使用model_construct跳过字段验证；
+客户端输入（如ChatCompletionRequest）仍需完整验证。
 """
 
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field
 from enum import Enum
 
@@ -77,14 +81,14 @@ class ChatCompletionResponse(BaseResponse):
         finish_reason: FinishReason = FinishReason.STOP,
         usage: Optional[Usage] = None
     ) -> "ChatCompletionResponse":
-        """创建聊天完成响应"""
-        return cls(
+        """创建聊天完成响应（服务端生成的数据，跳过字段验证）"""
+        return cls.model_construct(
             id=response_id,
             model=model,
             choices=[
-                Choice(
+                Choice.model_construct(
                     index=0,
-                    message=Message(
+                    message=Message.model_construct(
                         role=MessageRole.ASSISTANT,
                         content=message_content
                     ),
@@ -109,19 +113,18 @@ class ChatCompletionStreamResponse(BaseResponse):
         model: str = "claude-3-sonnet-20240229",
         finish_reason: Optional[FinishReason] = None
     ) -> "ChatCompletionStreamResponse":
-        """创建流式响应"""
-        delta = Delta()
-        if delta_role:
-            delta.role = delta_role
+        """创建流式响应（每个数据块都会调用，服务端生成的数据跳过字段验证）"""
         # 修改：当传入空字符串时也保留content字段，避免出现null
-        if delta_content is not None:
-            delta.content = delta_content
+        delta = Delta.model_construct(
+            role=delta_role or None,
+            content=delta_content
+        )
 
-        return cls(
+        return cls.model_construct(
             id=response_id,
             model=model,
             choices=[
-                Choice(
+                Choice.model_construct(
                     index=0,
                     delta=delta,
                     finish_reason=finish_reason
@@ -130,6 +133,46 @@ class ChatCompletionStreamResponse(BaseResponse):
         )
 
 
+def create_stream_chunk(
+    response_id: str,
+    model: str,
+    delta_content: Optional[str] = None,
+    delta_role: Optional[MessageRole] = None,
+    finish_reason: Optional[FinishReason] = None,
+    exclude_none: bool = True
+) -> Dict[str, Any]:
+    """
+    直接构建流式响应数据块字典，跳过Pydantic模型
+
+    结构与ChatCompletionStreamResponse.create(...).dict(exclude_none=...)相同，
+    该模型仅保留用于接口文档。
+    """
+    if exclude_none:
+        delta: Dict[str, Any] = {}
+        if delta_role:
+            delta["role"] = delta_role
+        if delta_content is not None:
+            delta["content"] = delta_content
+        choice: Dict[str, Any] = {"index": 0, "delta": delta}
+        if finish_reason is not None:
+            choice["finish_reason"] = finish_reason
+    else:
+        choice = {
+            "index": 0,
+            "message": None,
+            "delta": {"role": delta_role or None, "content": delta_content},
+            "finish_reason": finish_reason
+        }
+
+    return {
+        "id": response_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [choice]
+    }
+
+
 class ErrorDetail(BaseModel):
     """错误详情"""
     message: str
@@ -151,9 +194,9 @@ class ErrorResponse(BaseModel):
         param: Optional[str] = None,
         code: Optional[str] = None
     ) -> "ErrorResponse":
-        """创建错误响应"""
-        return cls(
-            error=ErrorDetail(
+        """创建错误响应（服务端生成的数据，跳过字段验证）"""
+        return cls.model_construct(
+            error=ErrorDetail.model_construct(
                 message=message,
                 type=error_type,
                 param=param,
@@ -177,15 +220,15 @@ class ModelsResponse(BaseModel):
 
     @classmethod
     def create_default(cls) -> "ModelsResponse":
-        """创建默认模型列表"""
-        return cls(
+        """创建默认模型列表（静态数据，跳过字段验证）"""
+        return cls.model_construct(
             data=[
-                ModelInfo(
+                ModelInfo.model_construct(
                     id="gpt-5",
                     created=1677610602,
                     owned_by="openai"
                 ),
-                ModelInfo(
+                ModelInfo.model_construct(
                     id="GLM-4.6",
                     created=1677610602,
                     owned_by="zhipu"
@@ -194,6 +237,10 @@ class ModelsResponse(BaseModel):
         )
 
 
+# 默认模型列表的JSON响应体，导入时序列化一次，ModelsResponse保留用于接口文档
+DEFAULT_MODELS_JSON: bytes = ModelsResponse.create_default().model_dump_json().encode("utf-8")
+
+
 class HealthResponse(BaseModel):
     """健康检查响应"""
     status: str = "healthy"
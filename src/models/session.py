@@ -5,11 +5,9 @@
 """
 
 from datetime import datetime, timedelta
+import secrets
 from typing import Dict, List, Optional, Any
 from pydantic import BaseModel, Field
-import uuid
-
-from .message import ChatMessage
 
 
 class Session(BaseModel):
@@ -42,22 +40,24 @@ class Session(BaseModel):
         self.last_activity = datetime.now()
         self.message_count += 1
 
-    def is_expired(self) -> bool:
+    # 以下方法的now参数供批量检查多个会话的调用方传入同一时间，未传入时读取当前时间
+
+    def is_expired(self, now: Optional[datetime] = None) -> bool:
         """检查会话是否过期"""
         expiry_time = self.last_activity + timedelta(minutes=self.timeout_minutes)
-        return datetime.now() > expiry_time
+        return (now or datetime.now()) > expiry_time
 
-    def should_cleanup(self) -> bool:
+    def should_cleanup(self, now: Optional[datetime] = None) -> bool:
         """检查会话是否应该被清理"""
-        return not self.is_active or self.is_expired()
+        return not self.is_active or self.is_expired(now)
 
-    def get_session_age(self) -> timedelta:
+    def get_session_age(self, now: Optional[datetime] = None) -> timedelta:
         """获取会话年龄"""
-        return datetime.now() - self.created_at
+        return (now or datetime.now()) - self.created_at
 
-    def get_idle_time(self) -> timedelta:
+    def get_idle_time(self, now: Optional[datetime] = None) -> timedelta:
         """获取空闲时间"""
-        return datetime.now() - self.last_activity
+        return (now or datetime.now()) - self.last_activity
 
     def add_metadata(self, key: str, value: Any) -> None:
         """添加元数据"""
@@ -78,7 +78,7 @@ class SessionCreateRequest(BaseModel):
 
     def create_session(self, **kwargs) -> Session:
         """创建会话实例"""
-        session_id = self.session_id or f"session_{uuid.uuid4().hex[:12]}"
+        session_id = self.session_id or f"session_{secrets.token_hex(6)}"
 
         return Session(
             session_id=session_id,
@@ -108,7 +108,7 @@ class SessionUpdateRequest(BaseModel):
 
 
 class SessionInfo(BaseModel):
-    """会话信息响应"""
+    """会话信息响应（只用于序列化，metadata与会话共享，不应修改）"""
     session_id: str
     created_at: datetime
     last_activity: datetime
@@ -120,19 +120,23 @@ class SessionInfo(BaseModel):
     metadata: Dict[str, Any] = Field(default_factory=dict)
 
     @classmethod
-    def from_session(cls, session: Session) -> "SessionInfo":
-        """从会话创建信息"""
-        now = datetime.now()
-        return cls(
+    def from_session(cls, session: Session, now: Optional[datetime] = None) -> "SessionInfo":
+        """从会话创建信息（字段来自已验证的会话对象，跳过字段验证）"""
+        if now is None:
+            now = datetime.now()
+        # 空闲时间同时用于过期判断，与is_expired()等价但只计算一次差值
+        idle_time = now - session.last_activity
+        return cls.model_construct(
             session_id=session.session_id,
             created_at=session.created_at,
             last_activity=session.last_activity,
             message_count=session.message_count,
             is_active=session.is_active,
             age_seconds=int((now - session.created_at).total_seconds()),
-            idle_seconds=int((now - session.last_activity).total_seconds()),
-            is_expired=session.is_expired(),
-            metadata=session.metadata.copy()
+            idle_seconds=int(idle_time.total_seconds()),
+            is_expired=idle_time > timedelta(minutes=session.timeout_minutes),
+            # 只读响应直接引用会话的元数据，不复制
+            metadata=session.metadata
         )
 
 
@@ -146,12 +150,20 @@ class SessionListResponse(BaseModel):
     @classmethod
     def create_from_sessions(cls, sessions: List[Session]) -> "SessionListResponse":
         """从会话列表创建响应"""
-        session_infos = [SessionInfo.from_session(session) for session in sessions]
-
-        active_count = sum(1 for info in session_infos if info.is_active and not info.is_expired)
-        expired_count = sum(1 for info in session_infos if info.is_expired)
-
-        return cls(
+        now = datetime.now()
+        session_infos = []
+        active_count = expired_count = 0
+
+        # 一次遍历同时生成会话信息并统计数量
+        for session in sessions:
+            info = SessionInfo.from_session(session, now)
+            session_infos.append(info)
+            if info.is_expired:
+                expired_count += 1
+            elif info.is_active:
+                active_count += 1
+
+        return cls.model_construct(
             sessions=session_infos,
             total_count=len(session_infos),
             active_count=active_count,
@@ -6,9 +6,8 @@ API Key验证和频率限制服务
 
 import asyncio
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import logging
-from collections import defaultdict
 
 from ..models.api_key import (
     APIKeyConfig, APIKeyUsage, APIKeyValidationError,
@@ -27,10 +26,21 @@ class APIKeyService:
         self._usage_storage: Dict[str, APIKeyUsage] = {}
         # 锁保护并发访问
         self._lock = asyncio.Lock()
-
-    def _calculate_period_bounds(self, period: RateLimitPeriod) -> tuple[datetime, datetime]:
-        """计算周期的开始和结束时间"""
-        now = datetime.now(timezone.utc)
+        # 周期边界缓存：周期 -> (开始时间, 结束时间)，同一天/月内所有Key共用
+        self._bounds_cache: Dict[RateLimitPeriod, Tuple[datetime, datetime]] = {}
+
+    def _calculate_period_bounds(
+        self,
+        period: RateLimitPeriod,
+        now: Optional[datetime] = None
+    ) -> tuple[datetime, datetime]:
+        """计算周期的开始和结束时间（当前时间仍在缓存的周期内时直接复用）"""
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        cached = self._bounds_cache.get(period)
+        if cached is not None and cached[0] <= now < cached[1]:
+            return cached
 
         if period == RateLimitPeriod.DAY:
             # 日周期：从今天的00:00:00 UTC到明天的00:00:00 UTC
@@ -49,43 +59,72 @@ class APIKeyService:
         else:
             raise ValueError(f"Unsupported period: {period}")
 
+        self._bounds_cache[period] = (start, end)
         return start, end
 
-    async def _get_or_create_usage(self, api_key_config: APIKeyConfig) -> APIKeyUsage:
+    async def _get_or_create_usage(
+        self,
+        api_key_config: APIKeyConfig,
+        now: Optional[datetime] = None
+    ) -> APIKeyUsage:
         """获取或创建API Key使用记录"""
+        # 快速路径：记录已存在且周期未过期时无需加锁，只有创建和重置周期才需要锁
+        usage = self._usage_storage.get(api_key_config.key)
+        if usage is not None and not usage.is_period_expired(now):
+            return usage
+
         async with self._lock:
-            key = api_key_config.key
-
-            if key not in self._usage_storage:
-                # 创建新的使用记录
-                period_start, period_end = self._calculate_period_bounds(api_key_config.period)
-                usage = APIKeyUsage(
-                    api_key=key,
-                    current_period_requests=0,
-                    period_start=period_start,
-                    period_end=period_end
-                )
-                self._usage_storage[key] = usage
-            else:
-                usage = self._usage_storage[key]
+            # 加锁后重新检查，其他请求可能已经创建或重置了记录
+            return self._get_or_create_usage_locked(api_key_config, now)
+
+    def _get_or_create_usage_locked(
+        self,
+        api_key_config: APIKeyConfig,
+        now: Optional[datetime] = None
+    ) -> APIKeyUsage:
+        """获取或创建API Key使用记录（调用方需持有锁）"""
+        key = api_key_config.key
+        if now is None:
+            now = datetime.now(timezone.utc)
+
+        if key not in self._usage_storage:
+            # 创建新的使用记录
+            period_start, period_end = self._calculate_period_bounds(api_key_config.period, now)
+            usage = APIKeyUsage(
+                api_key=key,
+                current_period_requests=0,
+                period_start=period_start,
+                period_end=period_end
+            )
+            self._usage_storage[key] = usage
+        else:
+            usage = self._usage_storage[key]
 
-                # 检查周期是否已过期
-                if usage.is_period_expired():
-                    logger.info(f"API Key {key[:8]}... 的使用周期已过期，重置计数")
-                    period_start, period_end = self._calculate_period_bounds(api_key_config.period)
-                    usage.reset_period(period_start, period_end)
+            # 检查周期是否已过期
+            if usage.is_period_expired(now):
+                logger.info(f"API Key {key[:8]}... 的使用周期已过期，重置计数")
+                period_start, period_end = self._calculate_period_bounds(api_key_config.period, now)
+                usage.reset_period(period_start, period_end)
 
-            return usage
+        return usage
 
-    async def validate_api_key(self, api_key: str) -> tuple[bool, Optional[OpenAIErrorResponse]]:
+    async def validate_api_key(
+        self,
+        api_key: str,
+        record: bool = True
+    ) -> tuple[bool, Optional[OpenAIErrorResponse]]:
         """
         验证API Key并检查频率限制
 
         Args:
             api_key: 要验证的API Key
+            record: 是否计入使用次数（查询自身统计的请求不计数，否则统计每次查询都会变化）
 
         Returns:
             tuple: (是否有效, 错误响应)
+
+        Raises:
+            Exception: 验证过程中的内部错误原样抛出，不作为无效Key返回，避免调用方缓存该拒绝结果
         """
         try:
             # 检查是否启用API Key验证
@@ -100,8 +139,11 @@ class APIKeyService:
                     APIKeyValidationError.invalid_key()
                 )
 
+            # 本次请求的周期检查、重试时间和使用记录共用同一时间戳
+            now = datetime.now(timezone.utc)
+
             # 获取使用记录
-            usage = await self._get_or_create_usage(api_key_config)
+            usage = await self._get_or_create_usage(api_key_config, now)
 
             # 检查频率限制
             if not usage.can_make_request(api_key_config.max_requests):
@@ -110,7 +152,6 @@ class APIKeyService:
                              f"({api_key_config.period})")
 
                 # 计算重试时间（秒）
-                now = datetime.now(timezone.utc)
                 retry_after_seconds = int((usage.period_end - now).total_seconds())
 
                 return False, OpenAIErrorResponse.from_validation_error(
@@ -118,7 +159,8 @@ class APIKeyService:
                 )
 
             # 记录这次请求
-            usage.record_request()
+            if record:
+                usage.record_request(now)
 
             logger.debug(f"API Key {api_key[:8]}... 验证成功，"
                         f"当前周期使用: {usage.current_period_requests}/{api_key_config.max_requests}")
@@ -126,12 +168,12 @@ class APIKeyService:
             return True, None
 
         except Exception as e:
-            logger.error(f"API Key验证过程中发生错误: {e}")
-            import traceback
-            logger.error(f"错误详情: {traceback.format_exc()}")
-            return False, OpenAIErrorResponse.from_validation_error(
-                APIKeyValidationError.invalid_key()
+            # 只在调试模式下记录完整堆栈，避免错误集中出现时格式化堆栈拖慢服务
+            logger.error(
+                f"API Key验证过程中发生错误: {e}",
+                exc_info=logger.isEnabledFor(logging.DEBUG)
             )
+            raise
 
     async def get_usage_stats(self, api_key: str) -> Optional[Dict[str, Any]]:
         """
@@ -152,8 +194,37 @@ class APIKeyService:
 
         usage = await self._get_or_create_usage(api_key_config)
 
+        return self._format_usage_stats(api_key_config, usage)
+
+    async def get_usage_stats_bulk(self, api_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取API Key使用统计，只获取一次锁
+
+        Args:
+            api_keys: API Key列表
+
+        Returns:
+            API Key到使用统计的映射，不存在的Key不包含在结果中
+        """
+        if not config.api_key_enabled:
+            return {}
+
+        stats = {}
+        now = datetime.now(timezone.utc)
+        async with self._lock:
+            for api_key in api_keys:
+                api_key_config = config.get_api_key_config(api_key)
+                if api_key_config:
+                    usage = self._get_or_create_usage_locked(api_key_config, now)
+                    stats[api_key] = self._format_usage_stats(api_key_config, usage)
+
+        return stats
+
+    @staticmethod
+    def _format_usage_stats(api_key_config: APIKeyConfig, usage: APIKeyUsage) -> Dict[str, Any]:
+        """生成单个API Key的使用统计"""
         return {
-            "api_key": api_key[:8] + "...",  # 只显示前8位
+            "api_key": api_key_config.key[:8] + "...",  # 只显示前8位
             "current_period_requests": usage.current_period_requests,
             "max_requests": api_key_config.max_requests,
             "period": api_key_config.period,
@@ -197,8 +268,8 @@ class APIKeyService:
                 "period": key_config.period
             }
 
-            if key_config.key in self._usage_storage:
-                usage = self._usage_storage[key_config.key]
+            usage = self._usage_storage.get(key_config.key)
+            if usage is not None:
                 key_stats.update({
                     "current_usage": usage.current_period_requests,
                     "remaining": key_config.max_requests - usage.current_period_requests,
@@ -4,15 +4,34 @@ Claude内容解析器模块
 解析Claude的JSON输出，识别思维过程、规划步骤、工具使用等结构化信息。
 """
 
+import functools
 import json
 import re
-from typing import Dict, List, Any, Optional, Union
+from typing import Callable, Dict, List, Any, Optional
 from enum import Enum
 from dataclasses import dataclass
+from types import MappingProxyType
 import logging
+import orjson
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 logger = logging.getLogger(__name__)
 
+# 文本分类结果缓存：流式输出中常见的短句会反复出现，只缓存较短文本以限制内存占用
+_CLASSIFY_CACHE_MAXSIZE = 4096
+_CLASSIFY_CACHE_MAX_TEXT_LENGTH = 512
+
+# Todo状态对应的图标，未知状态使用📝
+_TODO_STATUS_EMOJI = {
+    "pending": "⏳",
+    "in_progress": "🔄",
+    "completed": "✅"
+}
+
 
 class ContentType(Enum):
     """内容类型枚举"""
@@ -29,9 +48,9 @@ class ContentType(Enum):
     REGULAR_TEXT = "regular_text"        # 常规文本
 
 
-@dataclass
+@dataclass(slots=True)
 class ParsedContent:
-    """解析后的内容"""
+    """解析后的内容（流式会话中会创建大量实例，使用slots省去每个实例的__dict__）"""
     content_type: ContentType
     content: str
     metadata: Dict[str, Any]
@@ -40,6 +59,14 @@ class ParsedContent:
     timestamp: Optional[str] = None
 
 
+# 空文本的解析结果，所有调用共享同一实例，调用方不应修改（元数据为只读映射）
+_EMPTY_PARSED_CONTENT = ParsedContent(
+    content_type=ContentType.REGULAR_TEXT,
+    content="",
+    metadata=MappingProxyType({})
+)
+
+
 class ClaudeContentParser:
     """Claude内容解析器"""
     
@@ -74,25 +101,111 @@ class ClaudeContentParser:
             "problem", "unable", "limitation", "API Error"
         ]
 
+        # 按优先级预处理各类别的关键词：统一转为小写（与转小写后的文本比较）并去重。
+        # 保持子串查找而不是合并为正则：str的C实现查找比re的多分支匹配快得多
+        categories = (
+            (ContentType.ERROR_HANDLING, self.error_keywords),
+            (ContentType.PLANNING, self.planning_keywords),
+            (ContentType.THINKING, self.thinking_keywords),
+            (ContentType.EXECUTION, self.execution_keywords),
+            (ContentType.ANALYSIS, self.analysis_keywords),
+        )
+        self._category_keywords = tuple(
+            (content_type, tuple(dict.fromkeys(keyword.lower() for keyword in keywords)))
+            for content_type, keywords in categories
+        )
+        # 已安装pyahocorasick时把所有关键词合并为一个自动机，文本只需扫描一遍；
+        # 预先绑定iter方法，分类时不再查找属性
+        self._automaton = self._build_automaton(categories) if ahocorasick is not None else None
+        self._iter_matches = self._automaton.iter if self._automaton is not None else None
+        # 未安装时使用按关键词展开生成的分类函数；纯ASCII文本不可能包含中文关键词，
+        # 另外生成只检查ASCII关键词的版本
+        if self._automaton is None:
+            self._match_keywords = self._compile_keyword_matcher()
+            self._match_ascii_keywords = self._compile_keyword_matcher(ascii_only=True)
+        else:
+            self._match_keywords = self._match_ascii_keywords = None
+        # 缓存绑定到实例，关键词属于实例属性
+        self._classify_cached = functools.lru_cache(maxsize=_CLASSIFY_CACHE_MAXSIZE)(
+            self._classify_uncached
+        )
+        # 结构化信息分派表：内容类型 -> (结果字段, 条目构造函数)
+        self._structured_handlers = {
+            ContentType.THINKING: ("thinking_process", self._content_entry),
+            ContentType.PLANNING: ("planning_steps", self._planning_entry),
+            ContentType.TOOL_USE: ("tool_usage", self._tool_usage_entry),
+            ContentType.EXECUTION: ("execution_flow", self._content_entry),
+            ContentType.ERROR_HANDLING: ("error_handling", self._content_entry),
+            ContentType.ANALYSIS: ("analysis_results", self._content_entry),
+        }
+
+    @staticmethod
+    def _build_automaton(categories) -> "ahocorasick.Automaton":
+        """
+        构建关键词自动机，值为(优先级, 内容类型)，多个类别共有的关键词归属优先级最高者
+
+        每个关键词同时登记原始、小写、大写和首字母大写写法，匹配时直接扫描原文本，
+        不必为每段文本生成小写副本；中文关键词没有大小写，各写法相同。
+        """
+        automaton = ahocorasick.Automaton()
+        for priority, (content_type, keywords) in enumerate(categories):
+            for keyword in keywords:
+                for variant in (keyword, keyword.lower(), keyword.upper(), keyword.capitalize()):
+                    if variant not in automaton:
+                        automaton.add_word(variant, (priority, content_type))
+        automaton.make_automaton()
+        return automaton
+
+    def _compile_keyword_matcher(self, ascii_only: bool = False) -> Callable[[str], ContentType]:
+        """
+        生成内联所有关键词判断的分类函数
+
+        关键词在构造后固定，按优先级展开为`if 'a' in t or 'b' in t ...`链，
+        省去逐个遍历关键词元组的解释器开销。关键词经repr嵌入，不会注入代码。
+        ascii_only为True时只包含ASCII关键词，仅可用于纯ASCII文本。
+        """
+        lines = ["def match(t, types=types, regular_text=regular_text):"]
+        for index, (_, keywords) in enumerate(self._category_keywords):
+            if ascii_only:
+                keywords = [keyword for keyword in keywords if keyword.isascii()]
+                if not keywords:
+                    continue
+            conditions = " or ".join(f"{keyword!r} in t" for keyword in keywords)
+            lines.append(f"    if {conditions}:")
+            lines.append(f"        return types[{index}]")
+        lines.append("    return regular_text")
+
+        namespace = {
+            "types": tuple(content_type for content_type, _ in self._category_keywords),
+            "regular_text": ContentType.REGULAR_TEXT,
+        }
+        exec("\n".join(lines), namespace)
+        return namespace["match"]
+
     def parse_claude_json_line(self, json_line: str) -> Optional[ParsedContent]:
         """解析Claude输出的单行JSON"""
         try:
-            if not json_line.strip():
+            # 只有JSON对象才能被解析为内容，空行、保活和事件名等其他行不调用解析器
+            if not json_line.lstrip().startswith("{"):
                 return None
                 
-            data = json.loads(json_line)
+            data = orjson.loads(json_line)
             return self._classify_and_parse_content(data)
             
         except json.JSONDecodeError as e:
-            logger.warning(f"无法解析JSON行: {json_line[:100]}..., 错误: {e}")
+            # 使用%格式化，日志级别被过滤时不构建消息
+            logger.warning("无法解析JSON行: %.100s..., 错误: %s", json_line, e)
             return None
         except Exception as e:
-            logger.error(f"解析内容时出错: {e}")
+            logger.error("解析内容时出错: %s", e)
             return None
     
     def parse_text_content(self, text: str) -> ParsedContent:
         """解析纯文本内容，识别思维过程和结构化信息"""
-        if not text or not text.strip():
+        if not text:
+            return _EMPTY_PARSED_CONTENT
+
+        if not text.strip():
             return ParsedContent(
                 content_type=ContentType.REGULAR_TEXT,
                 content=text,
@@ -160,15 +273,17 @@ class ClaudeContentParser:
         )
 
     def _parse_assistant_content(self, data: Dict[str, Any]) -> Optional[ParsedContent]:
-        """解析Assistant内容"""
+        """
+        解析Assistant内容
+
+        返回第一个文本或工具调用内容项的解析结果；CLI每条消息通常只有一个内容项，
+        其他类型的内容项（如thinking）会被跳过，因此不能直接取第一项。
+        """
         message = data.get("message", {})
         content_items = message.get("content", [])
         session_id = data.get("session_id")
         
-        if not content_items:
-            return None
-        
-        # 处理多个内容项
+        # 查找第一个可解析的内容项（内容为空时直接返回None）
         for item in content_items:
             item_type = item.get("type", "")
             
@@ -265,30 +380,34 @@ class ClaudeContentParser:
         )
 
     def _classify_text_content(self, text: str) -> ContentType:
-        """分类文本内容"""
+        """分类文本内容（按错误处理、规划、思维、执行、分析的优先级匹配）"""
+        if len(text) <= _CLASSIFY_CACHE_MAX_TEXT_LENGTH:
+            return self._classify_cached(text)
+        return self._classify_uncached(text)
+
+    def _classify_uncached(self, text: str) -> ContentType:
+        """不经过缓存分类文本内容"""
+        if self._iter_matches is not None:
+            return self._classify_with_automaton(text)
+
         text_lower = text.lower()
-        
-        # 检查错误处理
-        if any(keyword in text_lower for keyword in self.error_keywords):
-            return ContentType.ERROR_HANDLING
-        
-        # 检查规划过程
-        if any(keyword in text_lower for keyword in self.planning_keywords):
-            return ContentType.PLANNING
-        
-        # 检查思维过程
-        if any(keyword in text_lower for keyword in self.thinking_keywords):
-            return ContentType.THINKING
-        
-        # 检查执行过程
-        if any(keyword in text_lower for keyword in self.execution_keywords):
-            return ContentType.EXECUTION
-        
-        # 检查分析过程
-        if any(keyword in text_lower for keyword in self.analysis_keywords):
-            return ContentType.ANALYSIS
-        
-        return ContentType.REGULAR_TEXT
+        # isascii()只检查字符串的存储类型，不需要扫描文本
+        if text_lower.isascii():
+            return self._match_ascii_keywords(text_lower)
+        return self._match_keywords(text_lower)
+
+    def _classify_with_automaton(self, text: str) -> ContentType:
+        """一次扫描找出优先级最高的匹配类别，命中最高优先级时提前返回"""
+        best_priority = len(self._category_keywords)
+        best_type = ContentType.REGULAR_TEXT
+
+        for _, (priority, content_type) in self._iter_matches(text):
+            if priority < best_priority:
+                if priority == 0:
+                    return content_type
+                best_priority, best_type = priority, content_type
+
+        return best_type
 
     def _format_todo_content(self, tool_input: Dict[str, Any]) -> str:
         """格式化Todo内容"""
@@ -296,32 +415,18 @@ class ClaudeContentParser:
         if not todos:
             return "创建任务列表"
         
-        formatted_todos = []
-        for todo in todos:
-            status = todo.get("status", "pending")
-            content = todo.get("content", "")
-            active_form = todo.get("activeForm", "")
-            status_emoji = {
-                "pending": "⏳",
-                "in_progress": "🔄", 
-                "completed": "✅"
-            }.get(status, "📝")
-            
-            formatted_todos.append(f"{status_emoji} {content}")
-        
-        return f"任务规划:\n" + "\n".join(formatted_todos)
+        return "任务规划:\n" + "\n".join(
+            f"{_TODO_STATUS_EMOJI.get(todo.get('status', 'pending'), '📝')} {todo.get('content', '')}"
+            for todo in todos
+        )
     
     def extract_active_forms(self, tool_input: Dict[str, Any]) -> List[str]:
         """提取所有的 activeForm 字段"""
-        todos = tool_input.get("todos", [])
-        active_forms = []
-        
-        for todo in todos:
-            active_form = todo.get("activeForm", "")
-            if active_form and active_form.strip():
-                active_forms.append(active_form)
-        
-        return active_forms
+        return [
+            active_form
+            for todo in tool_input.get("todos", [])
+            if (active_form := todo.get("activeForm", "")) and active_form.strip()
+        ]
 
     def extract_structured_info(self, parsed_contents: List[ParsedContent]) -> Dict[str, Any]:
         """从解析内容中提取结构化信息"""
@@ -335,51 +440,12 @@ class ClaudeContentParser:
             "session_info": {}
         }
         
+        handlers = self._structured_handlers
         for content in parsed_contents:
-            if content.content_type == ContentType.THINKING:
-                structured_info["thinking_process"].append({
-                    "content": content.content,
-                    "metadata": content.metadata
-                })
-            
-            elif content.content_type == ContentType.PLANNING:
-                planning_step = {
-                    "content": content.content,
-                    "tool_info": content.tool_info,
-                    "metadata": content.metadata
-                }
-                
-                # 添加 activeForm 信息
-                active_forms = content.metadata.get("active_forms", [])
-                if active_forms:
-                    planning_step["active_forms"] = active_forms
-                
-                structured_info["planning_steps"].append(planning_step)
-            
-            elif content.content_type == ContentType.TOOL_USE:
-                structured_info["tool_usage"].append({
-                    "tool_name": content.tool_info.get("tool_name") if content.tool_info else "unknown",
-                    "tool_input": content.tool_info.get("tool_input") if content.tool_info else {},
-                    "content": content.content
-                })
-            
-            elif content.content_type == ContentType.EXECUTION:
-                structured_info["execution_flow"].append({
-                    "content": content.content,
-                    "metadata": content.metadata
-                })
-            
-            elif content.content_type == ContentType.ERROR_HANDLING:
-                structured_info["error_handling"].append({
-                    "content": content.content,
-                    "metadata": content.metadata
-                })
-            
-            elif content.content_type == ContentType.ANALYSIS:
-                structured_info["analysis_results"].append({
-                    "content": content.content,
-                    "metadata": content.metadata
-                })
+            handler = handlers.get(content.content_type)
+            if handler is not None:
+                field, build_entry = handler
+                structured_info[field].append(build_entry(content))
             
             # 收集会话信息
             if content.session_id and not structured_info["session_info"]:
@@ -391,14 +457,45 @@ class ClaudeContentParser:
         
         return structured_info
 
+    @staticmethod
+    def _content_entry(content: ParsedContent) -> Dict[str, Any]:
+        """思维、执行、错误处理和分析内容的结构化条目"""
+        return {
+            "content": content.content,
+            "metadata": content.metadata
+        }
+
+    @staticmethod
+    def _planning_entry(content: ParsedContent) -> Dict[str, Any]:
+        """规划步骤的结构化条目"""
+        planning_step = {
+            "content": content.content,
+            "tool_info": content.tool_info,
+            "metadata": content.metadata
+        }
+
+        # 添加 activeForm 信息
+        active_forms = content.metadata.get("active_forms", [])
+        if active_forms:
+            planning_step["active_forms"] = active_forms
+
+        return planning_step
+
+    @staticmethod
+    def _tool_usage_entry(content: ParsedContent) -> Dict[str, Any]:
+        """工具使用的结构化条目"""
+        tool_info = content.tool_info
+        return {
+            "tool_name": tool_info.get("tool_name") if tool_info else "unknown",
+            "tool_input": tool_info.get("tool_input") if tool_info else {},
+            "content": content.content
+        }
+
 
-# 全局解析器实例
-_content_parser: Optional[ClaudeContentParser] = None
+# 全局解析器实例（导入时创建，关键词匹配结构只构建一次）
+content_parser = ClaudeContentParser()
 
 
 def get_content_parser() -> ClaudeContentParser:
     """获取全局内容解析器实例"""
-    global _content_parser
-    if _content_parser is None:
-        _content_parser = ClaudeContentParser()
-    return _content_parser
\ No newline at end of file
+    return content_parser
@@ -5,22 +5,74 @@ Claude服务模块
 """
 
 import asyncio
-import subprocess
 import json
+import os
+import time
 import uuid
-import shlex
 import shutil
-import sys
+from collections import OrderedDict
 from datetime import datetime
-from pathlib import Path
-from typing import AsyncIterator, Optional, List, Dict, Any
+from typing import AsyncIterator, Optional, List, Dict, Any, Set
 import logging
+import orjson
 
 from ..utils.config import config
 from ..utils.exceptions import ClaudeProcessError, ConfigurationError
 
 logger = logging.getLogger(__name__)
 
+# Claude CLI输出的StreamReader缓冲上限，超过该长度的行由_read_line分段读取
+_STDOUT_LINE_LIMIT = 8 * 1024 * 1024
+# 错误信息中保留的stderr末尾长度
+_STDERR_TAIL_LIMIT = 64 * 1024
+# 已确认存在的工作目录，同一目录只在首次使用时检查
+_validated_working_dirs: Set[str] = set()
+# Claude CLI命令名 -> shutil.which查找到的可执行文件路径
+_claude_command_paths: Dict[str, str] = {}
+# TodoWrite任务状态对应的显示图标
+_TODO_STATUS_EMOJI = {
+    "pending": "⏳",
+    "in_progress": "🔄",
+    "completed": "✅"
+}
+
+
+async def _read_line(stream: asyncio.StreamReader) -> bytes:
+    """
+    读取一行输出（包含换行符），EOF时返回剩余内容，没有剩余内容时返回b""
+
+    超过缓冲上限的行不会报错：已缓冲的部分移入bytearray后继续读取直到换行，
+    追加是均摊O(1)的，总开销与行长度成线性关系。
+    """
+    try:
+        return await stream.readuntil(b"\n")
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        buffer = bytearray(await stream.readexactly(e.consumed))
+
+    while True:
+        try:
+            buffer += await stream.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            buffer += e.partial
+        except asyncio.LimitOverrunError as e:
+            buffer += await stream.readexactly(e.consumed)
+            continue
+        return bytes(buffer)
+
+
+async def _collect_stderr(stream: asyncio.StreamReader) -> bytes:
+    """读取stderr直到EOF，只保留末尾_STDERR_TAIL_LIMIT字节用于错误信息"""
+    tail = bytearray()
+    while True:
+        chunk = await stream.read(_STDERR_TAIL_LIMIT)
+        if not chunk:
+            return bytes(tail)
+        tail += chunk
+        if len(tail) > _STDERR_TAIL_LIMIT:
+            del tail[:-_STDERR_TAIL_LIMIT]
+
 
 class ClaudeProcessConfig:
     """Claude进程配置"""
@@ -30,12 +82,13 @@ class ClaudeProcessConfig:
         working_dir: Optional[str] = None,
         session_id: Optional[str] = None,
         continue_session: bool = False,
-        timeout: int = 300
+        timeout: Optional[int] = None
     ):
         self.working_dir = working_dir or config.claude_working_dir
         self.session_id = session_id
         self.continue_session = continue_session
-        self.timeout = timeout
+        # 等待CLI的超时时间（秒）：写入消息或读取下一行输出超过该时间即视为卡住，终止CLI进程
+        self.timeout = timeout if timeout is not None else config.claude_timeout
 
 
 class ClaudeProcess:
@@ -49,42 +102,58 @@ class ClaudeProcess:
         self.created_at = datetime.now()
         self.claude_session_id: Optional[str] = None  # Claude 返回的真实会话ID
         self.claude_command_path: Optional[str] = None
+        # 最近一次使用的时间（time.monotonic()），用于空闲清理
+        self.last_used_at = time.monotonic()
+        # CLI进程的stderr读取任务，结果为stderr末尾内容
+        self._stderr_task: Optional["asyncio.Task[bytes]"] = None
+        # 同一进程的消息依次处理，避免多个回合的输出交错
+        self._send_lock = asyncio.Lock()
 
     async def start(self) -> None:
         """初始化Claude进程配置（命令行模式不需要启动持久进程）"""
         try:
-            # 验证工作目录
-            if self.config.working_dir and not Path(self.config.working_dir).exists():
-                raise ConfigurationError(
-                    f"Claude working directory does not exist: {self.config.working_dir}",
-                    "claude_working_dir"
-                )
-
-            # 验证Claude CLI是否可用
+            # 验证工作目录（首次检查在线程中执行，避免阻塞事件循环）
+            working_dir = self.config.working_dir
+            if working_dir and working_dir not in _validated_working_dirs:
+                if not await asyncio.to_thread(os.path.isdir, working_dir):
+                    raise ConfigurationError(
+                        f"Claude working directory does not exist: {working_dir}",
+                        "claude_working_dir"
+                    )
+                _validated_working_dirs.add(working_dir)
+
+            # 验证Claude CLI是否可用：缓存的路径已验证且文件未变化时直接使用
             claude_command_name = config.claude_command
-            claude_command_path = shutil.which(claude_command_name)
+            claude_command_path = _claude_command_paths.get(claude_command_name)
+            if claude_command_path is None or not config.is_claude_verified(claude_command_path):
+                claude_command_path = await asyncio.to_thread(shutil.which, claude_command_name)
 
-            if not claude_command_path:
-                raise ClaudeProcessError(f"Claude CLI命令未找到: {claude_command_name}")
-            
-            self.claude_command_path = claude_command_path
+                if not claude_command_path:
+                    raise ClaudeProcessError(f"Claude CLI命令未找到: {claude_command_name}")
 
-            test_command = [self.claude_command_path, "--version"]
-            try:
-                process = await asyncio.create_subprocess_exec(
-                    *test_command,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-                stdout, stderr = await process.communicate()
-                if process.returncode != 0:
-                    raise ClaudeProcessError(f"Claude CLI不可用: {stderr.decode('utf-8')}")
-            except FileNotFoundError:
-                # This case should now be handled by shutil.which, but kept for safety
-                raise ClaudeProcessError(f"Claude CLI命令未找到: {claude_command_name}")
+                # 同一可执行文件只需验证一次（文件修改后重新验证），新会话不必每次启动子进程
+                if not config.is_claude_verified(claude_command_path):
+                    test_command = [claude_command_path, "--version"]
+                    try:
+                        process = await asyncio.create_subprocess_exec(
+                            *test_command,
+                            stdout=asyncio.subprocess.PIPE,
+                            stderr=asyncio.subprocess.PIPE
+                        )
+                        stdout, stderr = await process.communicate()
+                        if process.returncode != 0:
+                            raise ClaudeProcessError(f"Claude CLI不可用: {stderr.decode('utf-8')}")
+                    except FileNotFoundError:
+                        # This case should now be handled by shutil.which, but kept for safety
+                        raise ClaudeProcessError(f"Claude CLI命令未找到: {claude_command_name}")
+                    config.mark_claude_verified(claude_command_path)
+
+                _claude_command_paths[claude_command_name] = claude_command_path
+
+            self.claude_command_path = claude_command_path
 
             self.is_running = True
-            logger.info(f"Claude CLI配置验证成功", extra={
+            logger.info("Claude CLI配置验证成功", extra={
                 "process_id": self.process_id,
                 "working_dir": self.config.working_dir,
                 "claude_command": self.claude_command_path
@@ -95,206 +164,267 @@ class ClaudeProcess:
             raise ClaudeProcessError(f"Failed to initialize Claude CLI: {e}")
 
     async def send_message(self, message: str) -> AsyncIterator[str]:
-        """使用命令行模式发送消息并获取响应（实时流式解析stream-json格式）"""
-        try:
-            # 构建命令行参数
-            command = self._build_query_command(message)
-            
-            # 打印完整的Claude CLI命令
-            print(f"🚀 Claude CLI命令: {' '.join(command)}")
-            
-            # 记录要执行的完整命令
-            logger.info(f"🚀 开始执行Claude CLI命令: {' '.join(command)}", extra={
-                "process_id": self.process_id,
-                "message_length": len(message),
-                "full_command": command
-            })
-
-            # 执行命令并获取输出
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=self.config.working_dir if self.config.working_dir else None
-            )
-
-            logger.info(f"📡 Claude CLI进程已启动，PID: {process.pid}", extra={
-                "process_id": self.process_id,
-                "claude_pid": process.pid
-            })
-
-            # 实时读取stdout流
-            line_buffer = ""
-            byte_buffer = b""  # 字节缓冲区，用于处理多字节UTF-8字符
+        """
+        发送消息并获取响应（stream-json格式输入输出，实时流式解析）
+
+        消息以JSON行写入CLI的stdin，读取到本回合的result消息即结束。按会话缓存的进程在回合结束后
+        继续运行，后续消息直接写入同一进程，不必每条消息重新启动CLI；其他进程写入消息后关闭stdin，
+        CLI完成本回合后退出。回合未正常结束（取消或出错）时进程输出已无法与后续消息对应，
+        直接终止，下次发送时重新启动并恢复会话。
+        """
+        async with self._send_lock:
+            self.last_used_at = time.monotonic()
+            turn_complete = False
             line_count = 0
             content_chunks = 0
-            
             try:
-                while True:
-                    # 读取一个字节
-                    chunk = await process.stdout.read(1)
-                    if not chunk:
-                        # 进程结束，处理剩余的字节缓冲区
-                        if byte_buffer:
-                            try:
-                                remaining_text = byte_buffer.decode('utf-8')
-                                line_buffer += remaining_text
-                            except UnicodeDecodeError:
-                                logger.warning(f"⚠️ 进程结束时发现无法解码的字节: {byte_buffer}")
-                        break
-                    
-                    # 将字节添加到缓冲区
-                    byte_buffer += chunk
-                    
-                    # 尝试解码缓冲区中的字节
-                    try:
-                        # 尝试解码整个缓冲区
-                        decoded_text = byte_buffer.decode('utf-8')
-                        # 解码成功，将文本添加到行缓冲区，清空字节缓冲区
-                        line_buffer += decoded_text
-                        byte_buffer = b""
+                if self.process is None or self.process.returncode is not None:
+                    # 已被stop()（缓存淘汰、空闲清理）的对象不再启动CLI：它已不在服务缓存中，
+                    # 重新启动的常驻进程将无人清理，调用方需通过get_or_create_process重新获取
+                    if not self.is_running:
+                        raise ClaudeProcessError("Claude进程已停止，需要重新获取进程")
+                    self.process = await self._spawn()
+                process = self.process
+
+                # 空闲超时：CLI迟迟不读取消息或长时间没有输出时不能一直占用进程和会话锁；
+                # 每次等待CLI时重新计时，下游消费已返回内容的时间和持续输出的长回合都不受限制
+                timeout = self.config.timeout
+                timeout_message = f"Claude CLI超过{timeout}秒没有响应"
+
+                logger.info(f"🚀 发送消息到Claude CLI进程，PID: {process.pid}", extra={
+                    "process_id": self.process_id,
+                    "message_length": len(message)
+                })
+                process.stdin.write(orjson.dumps({
+                    "type": "user",
+                    "message": {
+                        "role": "user",
+                        "content": [{"type": "text", "text": message}]
+                    }
+                }) + b"\n")
+                try:
+                    async with asyncio.timeout(timeout):
+                        await process.stdin.drain()
+                except TimeoutError:
+                    raise ClaudeProcessError(timeout_message)
+                if not self.keeps_alive:
+                    process.stdin.close()
+
+                # 调试日志在每行都会执行，先判断一次级别，未启用时不构造日志参数
+                debug_enabled = logger.isEnabledFor(logging.DEBUG)
+
+                # 实时逐行读取stdout流（StreamReader在C层查找换行）
+                try:
+                    while True:
+                        try:
+                            async with asyncio.timeout(timeout):
+                                raw_line = await _read_line(process.stdout)
+                        except TimeoutError:
+                            raise ClaudeProcessError(timeout_message)
+                        if not raw_line:
+                            # 进程结束
+                            break
+                        
+                        line_count += 1
+                        
+                        if not raw_line.strip():
+                            continue
+                        
+                        # stream-json的每条消息都是JSON对象，其他行（如日志、提示信息）直接跳过，
+                        # 不必进入解析器再处理解析异常
+                        if not raw_line.lstrip().startswith(b"{"):
+                            if debug_enabled:
+                                logger.debug("⏭️ 跳过非JSON行 第%d行: %.100r", line_count, raw_line, extra={
+                                    "process_id": self.process_id,
+                                    "line_number": line_count
+                                })
+                            continue
                         
-                        # 检查是否有完整的行
-                        while '\n' in line_buffer:
-                            line, line_buffer = line_buffer.split('\n', 1)
-                            line_count += 1
-                            
-                            if not line.strip():
-                                continue
-                            
-                            # 打印Claude CLI的原始输出
-                            print(f"📥 Claude CLI原始输出 - 第{line_count}行: {line}")
-                            
-                            logger.debug(f"📥 接收到第{line_count}行数据: {line[:100]}{'...' if len(line) > 100 else ''}", extra={
+                        if debug_enabled:
+                            logger.debug("📥 接收到第%d行数据: %.100r", line_count, raw_line, extra={
                                 "process_id": self.process_id,
                                 "line_number": line_count,
-                                "line_length": len(line)
+                                "line_length": len(raw_line)
                             })
-                            
-                            try:
-                                json_data = json.loads(line)
-                                
-                                logger.debug(f"🔍 解析JSON成功: type={json_data.get('type')}, keys={list(json_data.keys())}", extra={
-                                    "process_id": self.process_id
+                        
+                        try:
+                            # 直接解析原始字节，只在解析失败时才需要解码；
+                            # orjson.JSONDecodeError是json.JSONDecodeError的子类，下方的异常处理不变
+                            json_data = orjson.loads(raw_line)
+                    
+                            # 提取会话ID（从任何包含session_id的JSON对象中）
+                            if 'session_id' in json_data and not self.claude_session_id:
+                                self.claude_session_id = json_data['session_id']
+                                logger.info(f"🔑 提取到会话ID: {self.claude_session_id}", extra={
+                                    "process_id": self.process_id,
+                                    "session_id": self.claude_session_id
                                 })
+                    
+                            # 处理assistant消息类型，提取并流式返回内容
+                            if json_data.get('type') == 'assistant' and 'message' in json_data:
+                                message_data = json_data['message']
+                        
+                                if 'content' in message_data and isinstance(message_data['content'], list):
+                                    # 同一消息中连续的文本片段合并后一次返回，减少下游的分块数；
+                                    # 工具调用单独返回，以便下游分别识别内容类型
+                                    text_parts: List[str] = []
+                                    for content_item in message_data['content']:
+                                        # 处理文本内容
+                                        if content_item.get('type') == 'text' and 'text' in content_item:
+                                            text = content_item['text']
+                                            if text.strip():  # 只处理非空文本
+                                                text_parts.append(text)
                                 
-                                # 提取会话ID（从任何包含session_id的JSON对象中）
-                                if 'session_id' in json_data and not self.claude_session_id:
-                                    self.claude_session_id = json_data['session_id']
-                                    logger.info(f"🔑 提取到会话ID: {self.claude_session_id}", extra={
-                                        "process_id": self.process_id,
-                                        "session_id": self.claude_session_id
-                                    })
-                                
-                                # 检查result类型的对象
-                                if json_data.get('type') == 'result':
-                                    logger.debug(f"🎯 发现result对象: {json_data}", extra={
-                                        "process_id": self.process_id
-                                    })
-                                
-                                # 处理assistant消息类型，提取并流式返回内容
-                                if json_data.get('type') == 'assistant' and 'message' in json_data:
-                                    message_data = json_data['message']
-                                    
-                                    if 'content' in message_data and isinstance(message_data['content'], list):
-                                        for content_item in message_data['content']:
-                                            # 处理文本内容
-                                            if content_item.get('type') == 'text' and 'text' in content_item:
-                                                text = content_item['text']
-                                                if text.strip():  # 只处理非空文本
-                                                    content_chunks += 1
-                                                    yield text + "\n"
-                                            
-                                            # 处理工具调用
-                                            elif content_item.get('type') == 'tool_use':
-                                                tool_name = content_item.get('name', '')
-                                                tool_input = content_item.get('input', {})
-                                                tool_id = content_item.get('id', '')
-                                                
-                                                # 格式化工具调用信息
-                                                if tool_name == "TodoWrite":
-                                                    tool_call_info = self._format_todo_write_display(tool_input)
-                                                else:
-                                                    tool_call_info = "```\n🔧 工具调用: " + tool_name + "\n"
-                                                    if tool_input:
-                                                        tool_call_info += "📝 参数: " + json.dumps(tool_input, ensure_ascii=False, indent=2) + "\n"
-                                                    tool_call_info += "```"
-                                                
+                                        # 处理工具调用
+                                        elif content_item.get('type') == 'tool_use':
+                                            if text_parts:
                                                 content_chunks += 1
-                                                yield tool_call_info + "\n"
-                                
-                                # 跳过result类型消息，避免与assistant消息内容重复
-                                elif json_data.get('type') == 'result':
-                                    logger.debug(f"🔄 跳过result消息，避免重复内容", extra={
+                                                yield "\n".join(text_parts) + "\n"
+                                                text_parts.clear()
+
+                                            tool_name = content_item.get('name', '')
+                                            tool_input = content_item.get('input', {})
+                                    
+                                            # 格式化工具调用信息
+                                            if tool_name == "TodoWrite":
+                                                tool_call_info = self._format_todo_write_display(tool_input)
+                                            else:
+                                                tool_call_info = "```\n🔧 工具调用: " + tool_name + "\n"
+                                                if tool_input:
+                                                    tool_call_info += "📝 参数: " + orjson.dumps(
+                                                        tool_input, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+                                                    ).decode() + "\n"
+                                                tool_call_info += "```"
+                                    
+                                            content_chunks += 1
+                                            yield tool_call_info + "\n"
+
+                                    if text_parts:
+                                        content_chunks += 1
+                                        yield "\n".join(text_parts) + "\n"
+                    
+                            # result消息表示本回合结束，跳过其内容，避免与assistant消息内容重复
+                            elif json_data.get('type') == 'result':
+                                if debug_enabled:
+                                    logger.debug("🔄 跳过result消息，避免重复内容", extra={
                                         "process_id": self.process_id,
                                         "result_length": len(json_data.get('result', ''))
                                     })
-                                    continue
-                                
-                                # 处理其他类型的消息
-                                elif json_data.get('type') in ['thinking', 'tool_use']:
+                                turn_complete = True
+                                break
+                    
+                            # 处理其他类型的消息
+                            elif json_data.get('type') in ['thinking', 'tool_use']:
+                                if debug_enabled:
                                     msg_type = json_data.get('type')
-                                    logger.debug(f"🔄 处理{msg_type}类型消息", extra={
+                                    logger.debug("🔄 处理%s类型消息", msg_type, extra={
                                         "process_id": self.process_id,
                                         "message_type": msg_type
                                     })
-                                    
-                            except json.JSONDecodeError as e:
-                                logger.warning(f"⚠️ 无法解析JSON行: {line[:100]}{'...' if len(line) > 100 else ''}, 错误: {e}", extra={
-                                    "process_id": self.process_id,
-                                    "line_number": line_count
-                                })
-                                continue
                         
-                    except UnicodeDecodeError:
-                        # 解码失败，说明当前字节序列不完整，继续读取更多字节
-                        # 但要防止缓冲区无限增长
-                        if len(byte_buffer) > 4:  # UTF-8字符最多4字节
-                            # 如果缓冲区太大，可能是真的有问题，记录警告并重置
-                            logger.warning(f"⚠️ 字节缓冲区过大，可能存在编码问题: {byte_buffer}")
-                            byte_buffer = b""
-                        continue
-
-
-            except Exception as e:
-                logger.error(f"❌ 流式读取过程中出错: {e}", extra={
+                        except json.JSONDecodeError as e:
+                            line = raw_line.decode('utf-8', 'replace').rstrip('\n')
+                            logger.warning(f"⚠️ 无法解析JSON行: {line[:100]}{'...' if len(line) > 100 else ''}, 错误: {e}", extra={
+                                "process_id": self.process_id,
+                                "line_number": line_count
+                            })
+                            continue
+
+                except Exception as e:
+                    logger.error(f"❌ 流式读取过程中出错: {e}", extra={
+                        "process_id": self.process_id,
+                        "lines_processed": line_count,
+                        "content_chunks": content_chunks
+                    })
+                    raise
+
+                if not turn_complete or not self.keeps_alive:
+                    # 进程已退出或即将退出（stdin已关闭），等待退出并检查返回码
+                    await process.wait()
+                    stderr_output = await self._stderr_task
+                    self.process = self._stderr_task = None
+                    
+                    if process.returncode != 0:
+                        error_msg = stderr_output.decode('utf-8', 'replace') if stderr_output else "Unknown error"
+                        logger.error(f"❌ Claude CLI命令执行失败: {error_msg}", extra={
+                            "process_id": self.process_id,
+                            "return_code": process.returncode
+                        })
+                        raise ClaudeProcessError(f"Claude CLI执行失败: {error_msg}")
+                    turn_complete = True
+
+                logger.info(f"✅ Claude CLI回合完成，共处理{line_count}行，输出{content_chunks}块内容", extra={
                     "process_id": self.process_id,
-                    "lines_processed": line_count,
-                    "content_chunks": content_chunks
+                    "total_lines": line_count,
+                    "total_chunks": content_chunks
                 })
-                raise
 
-            # 等待进程完成并检查返回码
-            await process.wait()
-            
-            if process.returncode != 0:
-                stderr_output = await process.stderr.read()
-                error_msg = stderr_output.decode('utf-8') if stderr_output else "Unknown error"
-                logger.error(f"❌ Claude CLI命令执行失败: {error_msg}", extra={
-                    "process_id": self.process_id,
-                    "return_code": process.returncode
+            except asyncio.CancelledError:
+                logger.info("🛑 消息处理被取消", extra={"process_id": self.process_id})
+                raise
+            except Exception as e:
+                logger.error(f"❌ 发送消息到Claude时出错: {e}", extra={
+                    "process_id": self.process_id
                 })
-                raise ClaudeProcessError(f"Claude CLI执行失败: {error_msg}")
+                raise ClaudeProcessError(f"Error sending message to Claude: {e}")
+            finally:
+                self.last_used_at = time.monotonic()
+                if not turn_complete:
+                    await self._terminate()
+
+    @property
+    def is_busy(self) -> bool:
+        """是否正在处理消息（处理中的进程不能被清理）"""
+        return self._send_lock.locked()
+
+    @property
+    def keeps_alive(self) -> bool:
+        """回合结束后是否保留CLI进程：只有按会话缓存、会被复用的进程才常驻"""
+        return bool(self.config.session_id)
+
+    async def _spawn(self) -> asyncio.subprocess.Process:
+        """启动Claude CLI进程，并在后台持续读取stderr"""
+        # 构建命令行参数
+        command = self._build_query_command()
+        
+        # 记录要执行的完整命令（参数列表由logging在输出时才格式化）
+        logger.info("🚀 开始执行Claude CLI命令: %s", command, extra={
+            "process_id": self.process_id
+        })
 
-            logger.info(f"✅ Claude CLI命令执行完成，共处理{line_count}行，输出{content_chunks}块内容", extra={
-                "process_id": self.process_id,
-                "total_lines": line_count,
-                "total_chunks": content_chunks
-            })
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.config.working_dir if self.config.working_dir else None,
+            limit=_STDOUT_LINE_LIMIT
+        )
+        # 常驻进程的stderr必须持续读取，否则管道写满后CLI会阻塞
+        self._stderr_task = asyncio.create_task(_collect_stderr(process.stderr))
 
-        except asyncio.CancelledError:
-            logger.info(f"🛑 消息处理被取消", extra={"process_id": self.process_id})
-            if 'process' in locals() and process.returncode is None:
-                process.terminate()
-                await process.wait()
-            raise
-        except Exception as e:
-            logger.error(f"❌ 发送消息到Claude时出错: {e}", extra={
-                "process_id": self.process_id
-            })
-            raise ClaudeProcessError(f"Error sending message to Claude: {e}")
+        logger.info(f"📡 Claude CLI进程已启动，PID: {process.pid}", extra={
+            "process_id": self.process_id,
+            "claude_pid": process.pid
+        })
+        return process
 
+    async def _terminate(self) -> None:
+        """终止CLI进程（如果仍在运行）"""
+        process, self.process = self.process, None
+        if process is None:
+            return
 
+        if process.returncode is None:
+            try:
+                process.terminate()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+            self._stderr_task = None
 
     def _build_command(self) -> List[str]:
         """构建Claude交互式命令行（已废弃，保留用于兼容性）"""
@@ -333,20 +463,21 @@ class ClaudeProcess:
                 "process_id": self.process_id
             })
 
-        logger.info(f"执行Claude CLI命令: {' '.join(command)}", extra={
+        logger.info("执行Claude CLI命令: %s", command, extra={
             "process_id": self.process_id,
-            "full_command": command,
-            "command_string": ' '.join(command)
+            "full_command": command
         })
         return command
 
-    def _build_query_command(self, message: str) -> List[str]:
-        """构建查询命令"""
+    def _build_query_command(self) -> List[str]:
+        """构建查询命令（消息通过stdin以stream-json格式发送）"""
         if not self.claude_command_path:
             raise ClaudeProcessError("Claude command path not initialized.")
         
         cmd = [
             self.claude_command_path,
+            "-p",
+            "--input-format", "stream-json",
             "--output-format", "stream-json",
             "--verbose",
             "--disallowedTools", "Bash,Edit,Read,Write,Glob,Grep,BashOutput,KillShell",
@@ -367,19 +498,12 @@ class ClaudeProcess:
                 "process_id": self.process_id
             })
         
-        # 添加会话ID
-        if self.config.session_id:
-            cmd.extend(["-r", self.config.session_id])
-        
-        # 添加消息
-        # 在Windows上，提示中的换行符会破坏命令。
-        # 将换行符替换为空格，以确保传递完整的提示。
-        processed_message = message
-        if sys.platform == "win32":
-            processed_message = message.replace('\n', '\\n')
-        cmd.extend(["-p", shlex.quote(processed_message)])
+        # 添加会话ID（进程重启时恢复已获得的Claude会话）
+        resume_session_id = self.claude_session_id or self.config.session_id
+        if resume_session_id:
+            cmd.extend(["-r", resume_session_id])
         
-        logger.info(f"🚀 构建的Claude命令: {' '.join(cmd)}", extra={
+        logger.info("🚀 构建的Claude命令: %s", cmd, extra={
             "process_id": self.process_id
         })
         
@@ -391,10 +515,21 @@ class ClaudeProcess:
         if not todos:
             return "```\n📋 创建空任务列表\n```"
 
-        # 统计任务状态
-        pending_count = sum(1 for todo in todos if todo.get("status") == "pending")
-        in_progress_count = sum(1 for todo in todos if todo.get("status") == "in_progress")
-        completed_count = sum(1 for todo in todos if todo.get("status") == "completed")
+        # 一次遍历统计任务状态并生成任务概要（使用无序号缩进格式）
+        in_progress_count = 0
+        completed_count = 0
+        todo_lines = []
+        for todo in todos:
+            status = todo.get("status", "pending")
+            if status == "in_progress":
+                in_progress_count += 1
+            elif status == "completed":
+                completed_count += 1
+
+            # 使用activeForm作为显示内容（如果存在且不为空）
+            active_form = todo.get("activeForm", "")
+            display_content = active_form if active_form and active_form.strip() else todo.get("content", "")
+            todo_lines.append(f"  {_TODO_STATUS_EMOJI.get(status, '📝')} {display_content}\n")
 
         # 确定操作类型
         if in_progress_count > 0:
@@ -411,30 +546,13 @@ class ClaudeProcess:
             result += f"，进行中 {in_progress_count} 项"
         result += ")\n"
 
-        # 添加任务概要（使用无序号缩进格式）
-        for todo in todos:
-            status = todo.get("status", "pending")
-            content = todo.get("content", "")
-            active_form = todo.get("activeForm", "")
-
-            status_emoji = {
-                "pending": "⏳",
-                "in_progress": "🔄",
-                "completed": "✅"
-            }.get(status, "📝")
-
-            # 使用activeForm作为显示内容（如果存在且不为空）
-            display_content = active_form if active_form and active_form.strip() else content
-
-            result += f"  {status_emoji} {display_content}\n"
-
-        result += "```"
-        return result
+        return result + "".join(todo_lines) + "```"
 
     async def stop(self) -> None:
-        """停止Claude进程（命令行模式下只需要标记为停止）"""
+        """停止Claude进程，终止常驻的CLI进程"""
         if self.is_running:
             self.is_running = False
+            await self._terminate()
             logger.info(f"Claude CLI session stopped", extra={
                 "process_id": self.process_id
             })
@@ -458,8 +576,26 @@ class ClaudeService:
 
     def __init__(self):
         self.active_processes: Dict[str, ClaudeProcess] = {}
-        # 新增：基于session_id的进程缓存
-        self.session_processes: Dict[str, ClaudeProcess] = {}
+        # 基于session_id的进程缓存，按最近使用排序（最久未使用的在前）
+        self.session_processes: OrderedDict[str, ClaudeProcess] = OrderedDict()
+        self.cleanup_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """启动空闲进程清理任务"""
+        if self.cleanup_task is None:
+            self.cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self) -> None:
+        """停止清理任务并清理所有进程"""
+        if self.cleanup_task:
+            self.cleanup_task.cancel()
+            try:
+                await self.cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self.cleanup_task = None
+
+        await self.cleanup_all_processes()
 
     async def get_or_create_process(
         self,
@@ -473,6 +609,8 @@ class ClaudeService:
         if session_id and session_id in self.session_processes:
             existing_process = self.session_processes[session_id]
             if existing_process.is_running:
+                self.session_processes.move_to_end(session_id)
+                existing_process.last_used_at = time.monotonic()
                 logger.info(f"重用现有Claude进程", extra={
                     "session_id": session_id,
                     "process_id": existing_process.process_id
@@ -507,6 +645,7 @@ class ClaudeService:
                 "session_id": session_id,
                 "process_id": process.process_id
             })
+            await self._evict_least_recently_used()
 
         return process
 
@@ -532,14 +671,9 @@ class ClaudeService:
         if process_id in self.active_processes:
             process = self.active_processes.pop(process_id)
             
-            # 从session缓存中移除
-            session_id_to_remove = None
-            for sid, cached_process in self.session_processes.items():
-                if cached_process.process_id == process_id:
-                    session_id_to_remove = sid
-                    break
-            
-            if session_id_to_remove:
+            # 从session缓存中移除（缓存键即进程配置的session_id）
+            session_id_to_remove = process.config.session_id
+            if session_id_to_remove and self.session_processes.get(session_id_to_remove) is process:
                 del self.session_processes[session_id_to_remove]
                 logger.info(f"从session缓存中移除进程", extra={
                     "session_id": session_id_to_remove,
@@ -560,6 +694,53 @@ class ClaudeService:
                 "process_id": process.process_id
             })
 
+    async def _evict_least_recently_used(self) -> None:
+        """缓存超过上限时停止最久未使用的空闲进程（正在处理消息的进程和刚缓存的进程不淘汰）"""
+        excess = len(self.session_processes) - config.max_cached_processes
+        if excess <= 0:
+            return
+
+        evicted = [
+            process for process in list(self.session_processes.values())[:-1]
+            if not process.is_busy
+        ][:excess]
+        for process in evicted:
+            logger.info("淘汰最久未使用的Claude进程", extra={
+                "session_id": process.config.session_id,
+                "process_id": process.process_id
+            })
+            await self.remove_process(process.process_id)
+
+    async def cleanup_idle_processes(self) -> int:
+        """清理空闲超时的进程"""
+        deadline = time.monotonic() - config.process_idle_timeout
+        idle_processes = [
+            process for process in self.active_processes.values()
+            if process.last_used_at < deadline and not process.is_busy
+        ]
+
+        for process in idle_processes:
+            await self.remove_process(process.process_id)
+
+        if idle_processes:
+            logger.info("Cleaned up idle Claude processes", extra={
+                "cleaned_count": len(idle_processes),
+                "active_processes": len(self.active_processes)
+            })
+
+        return len(idle_processes)
+
+    async def _cleanup_loop(self) -> None:
+        """清理循环"""
+        while True:
+            try:
+                await asyncio.sleep(config.session_cleanup_interval)
+                await self.cleanup_idle_processes()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in process cleanup loop: {e}")
+
     async def cleanup_all_processes(self) -> None:
         """清理所有活跃进程"""
         for process_id in list(self.active_processes.keys()):
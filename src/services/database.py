@@ -3,7 +3,6 @@ SQLite数据库管理模块
 用于持久化存储session信息和映射关系
 """
 
-import sqlite3
 import asyncio
 import aiosqlite
 import logging
@@ -12,7 +11,6 @@ from typing import Optional, Dict, List, Any
 from pathlib import Path
 import json
 
-from ..utils.config import config
 
 logger = logging.getLogger(__name__)
 
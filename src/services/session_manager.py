@@ -6,11 +6,10 @@
 
 import asyncio
 import json
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Set
+from datetime import datetime
+from typing import Dict, List, Optional
 import logging
 from collections import defaultdict
-import weakref
 
 from ..models.session import Session, SessionCreateRequest, SessionUpdateRequest
 from ..models.message import ChatMessage
@@ -263,20 +262,20 @@ class SessionManager:
     async def get_active_sessions(self) -> List[Session]:
         """获取所有活跃会话"""
         active_sessions = []
+        now = datetime.now()
         for session in list(self.sessions.values()):
-            if session.is_active and not session.is_expired():
+            expired = session.is_expired(now)
+            if session.is_active and not expired:
                 active_sessions.append(session)
-            elif session.is_expired():
+            elif expired:
                 await self.remove_session(session.session_id)
 
         return active_sessions
 
     async def get_expired_sessions(self) -> List[Session]:
         """获取过期会话"""
-        expired_sessions = []
-        for session in self.sessions.values():
-            if session.is_expired():
-                expired_sessions.append(session)
+        now = datetime.now()
+        expired_sessions = [session for session in self.sessions.values() if session.is_expired(now)]
 
         return expired_sessions
 
@@ -331,7 +330,8 @@ class SessionManager:
 
     def get_active_session_count(self) -> int:
         """获取活跃会话数量"""
-        return len([s for s in self.sessions.values() if s.is_active and not s.is_expired()])
+        now = datetime.now()
+        return sum(1 for s in self.sessions.values() if s.is_active and not s.is_expired(now))
 
     def get_stats(self) -> Dict[str, int]:
         """获取统计信息"""
@@ -4,22 +4,26 @@
 处理Server-Sent Events格式的流式响应。
 """
 
-import json
 import asyncio
-from typing import AsyncIterator, Dict, Any, Optional, List
+from typing import AsyncIterator, Dict, Any, Optional, Union
 import logging
+import orjson
 
 from ..models.response import (
-    ChatCompletionStreamResponse,
-    Delta,
+    ChatCompletionResponse,
+    create_stream_chunk,
+    Usage,
     MessageRole,
     FinishReason
 )
 from ..utils.exceptions import StreamingError
-from .claude_content_parser import get_content_parser, ContentType, ParsedContent
+from .claude_content_parser import content_parser, ContentType, ParsedContent
 
 logger = logging.getLogger(__name__)
 
+# 流结束标记，原样作为SSE的data字段发送
+SSE_DONE = "[DONE]"
+
 
 class StreamService:
     """流式响应服务"""
@@ -32,23 +36,22 @@ class StreamService:
         response_id: str,
         claude_output: AsyncIterator[str],
         model: str = "claude-3-sonnet-20240229"
-    ) -> AsyncIterator[str]:
+    ) -> AsyncIterator[Union[Dict[str, Any], str]]:
         """创建Claude输出的流式响应
 
-        返回符合OpenAI SSE格式的数据流，包含结构化的思维过程信息
+        按顺序返回OpenAI格式的数据块字典（包含结构化的思维过程信息），最后返回SSE_DONE，
+        由响应层通过_format_sse_data编码为SSE格式
         """
         try:
-            parser = get_content_parser()
+            parser = content_parser
             parsed_contents = []
             
             # 发送开始角色（通常只在第一个chunk中）
-            yield self._format_sse_data(
-                ChatCompletionStreamResponse.create(
-                    response_id=response_id,
-                    delta_role=MessageRole.ASSISTANT,
-                    delta_content="",
-                    model=model
-                ).dict(exclude_none=True)
+            yield create_stream_chunk(
+                response_id=response_id,
+                delta_role=MessageRole.ASSISTANT,
+                delta_content="",
+                model=model
             )
 
             # 流式处理Claude输出
@@ -70,8 +73,7 @@ class StreamService:
                         )
                         
                         if response_data:
-                            formatted_data = self._format_sse_data(response_data)
-                            yield formatted_data
+                            yield response_data
                     
                     # 同时保持原有的文本流
                     content_buffer += line + "\n"
@@ -82,32 +84,30 @@ class StreamService:
                 summary_response = self._create_summary_response(
                     response_id, structured_info, model
                 )
-                yield self._format_sse_data(summary_response)
+                yield summary_response
 
             # 发送结束标记
-            yield self._format_sse_data(
-                ChatCompletionStreamResponse.create(
-                    response_id=response_id,
-                    finish_reason=FinishReason.STOP,
-                    model=model
-                ).dict(exclude_none=True)
+            yield create_stream_chunk(
+                response_id=response_id,
+                finish_reason=FinishReason.STOP,
+                model=model
             )
 
             # 发送完成标记
-            yield "data: [DONE]\n\n"
+            yield SSE_DONE
 
         except Exception as e:
             logger.error(f"Error in Claude stream: {e}", extra={
                 "response_id": response_id
             })
             # 发送错误响应
-            yield self._format_sse_data({
+            yield {
                 "error": {
                     "message": str(e),
                     "type": "streaming_error",
                     "code": "stream_interrupted"
                 }
-            })
+            }
 
     async def create_non_streaming_response(
         self,
@@ -117,7 +117,20 @@ class StreamService:
     ) -> str:
         """创建非流式响应
 
-        收集所有Claude输出并返回完整响应
+        收集所有Claude输出并返回完整响应的JSON字符串
+        """
+        response = await self.create_non_streaming_response_obj(response_id, claude_output, model)
+        return response.model_dump_json()
+
+    async def create_non_streaming_response_obj(
+        self,
+        response_id: str,
+        claude_output: AsyncIterator[str],
+        model: str = "claude-3-sonnet-20240229"
+    ) -> ChatCompletionResponse:
+        """创建非流式响应对象
+
+        收集所有Claude输出并直接返回响应模型，由响应层只序列化一次
         """
         try:
             content_parts = []
@@ -127,8 +140,6 @@ class StreamService:
 
             full_content = "".join(content_parts)
 
-            from ..models.response import ChatCompletionResponse, Usage, Message
-
             response = ChatCompletionResponse.create(
                 response_id=response_id,
                 message_content=full_content,
@@ -136,13 +147,14 @@ class StreamService:
             )
 
             # 估算token使用量（简化实现）
+            completion_tokens = len(full_content.split())
             response.usage = Usage(
                 prompt_tokens=0,  # TODO: 实现实际的token计算
-                completion_tokens=len(full_content.split()),
-                total_tokens=len(full_content.split())
+                completion_tokens=completion_tokens,
+                total_tokens=completion_tokens
             )
 
-            return response.json()
+            return response
 
         except Exception as e:
             logger.error(f"Error creating non-streaming response: {e}", extra={
@@ -158,7 +170,8 @@ class StreamService:
     ) -> Optional[Dict[str, Any]]:
         """创建结构化响应数据"""
         # 根据内容类型创建不同的响应
-        if parsed_content.content_type == ContentType.THINKING:
+        content_type = parsed_content.content_type
+        if content_type is ContentType.THINKING:
             return {
                 "id": response_id,
                 "object": "chat.completion.chunk",
@@ -178,7 +191,7 @@ class StreamService:
                 }]
             }
         
-        elif parsed_content.content_type == ContentType.PLANNING:
+        elif content_type is ContentType.PLANNING:
             planning_process = {
                 "type": "planning",
                 "content": parsed_content.content,
@@ -206,7 +219,7 @@ class StreamService:
                 }]
             }
         
-        elif parsed_content.content_type == ContentType.TOOL_USE:
+        elif content_type is ContentType.TOOL_USE:
             return {
                 "id": response_id,
                 "object": "chat.completion.chunk",
@@ -227,7 +240,7 @@ class StreamService:
                 }]
             }
         
-        elif parsed_content.content_type == ContentType.EXECUTION:
+        elif content_type is ContentType.EXECUTION:
             return {
                 "id": response_id,
                 "object": "chat.completion.chunk",
@@ -247,7 +260,7 @@ class StreamService:
                 }]
             }
         
-        elif parsed_content.content_type == ContentType.ERROR_HANDLING:
+        elif content_type is ContentType.ERROR_HANDLING:
             return {
                 "id": response_id,
                 "object": "chat.completion.chunk",
@@ -267,13 +280,14 @@ class StreamService:
                 }]
             }
         
-        elif parsed_content.content_type == ContentType.REGULAR_TEXT:
+        elif content_type is ContentType.REGULAR_TEXT:
             # 常规文本内容
-            return ChatCompletionStreamResponse.create(
+            return create_stream_chunk(
                 response_id=response_id,
                 delta_content=parsed_content.content,
-                model=model
-            ).dict()
+                model=model,
+                exclude_none=False
+            )
         
         return None
 
@@ -306,21 +320,23 @@ class StreamService:
             }]
         }
 
-    def _format_sse_data(self, data: Dict[str, Any]) -> str:
+    def _format_sse_data(self, data: Union[Dict[str, Any], str]) -> bytes:
         """格式化SSE数据
 
         Args:
-            data: 要发送的数据字典
+            data: 要发送的数据字典，或原样发送的字符串（如SSE_DONE）
 
         Returns:
-            格式化的SSE字符串
+            格式化的SSE字节串，响应层无需再次编码
         """
+        if isinstance(data, str):
+            return b"data: " + data.encode("utf-8") + b"\n\n"
+
         try:
-            json_data = json.dumps(data, ensure_ascii=False)
-            return f"data: {json_data}\n\n"
+            return b"data: " + orjson.dumps(data) + b"\n\n"
         except Exception as e:
             logger.error(f"Error formatting SSE data: {e}")
-            return f"data: {{\"error\": \"Failed to format response\"}}\n\n"
+            return b'data: {"error": "Failed to format response"}\n\n'
 
     def create_stream_id(self) -> str:
         """创建流ID"""
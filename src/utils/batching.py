@@ -0,0 +1,111 @@
+"""
+批量加载模块
+
+将短时间窗口内的并发查询合并为一次批量调用，再把结果分发给各个调用方。
+"""
+
+import asyncio
+import weakref
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class _LoopBatch(Generic[K]):
+    """单个事件循环上的批次状态"""
+
+    def __init__(self):
+        self.pending: Dict[K, List[asyncio.Future]] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+
+
+class BatchingLoader(Generic[K, V]):
+    """
+    批量加载器
+
+    请求到达后登记等待中的Future，在等待max_delay秒或累计max_batch_size个不同键后
+    统一调用batch_fn，相同键的并发请求共享同一次查询结果。
+    Future与事件循环绑定，因此批次状态按运行中的事件循环分别维护，模块级实例可安全复用。
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[K]], Awaitable[Dict[K, V]]],
+        max_batch_size: int = 32,
+        max_delay: float = 0.005
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._batches: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopBatch[K]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    async def load(self, key: K) -> Optional[V]:
+        """加载单个键的结果，键不存在时返回None"""
+        loop = asyncio.get_running_loop()
+        state = self._batches.get(loop)
+        if state is None:
+            state = self._batches[loop] = _LoopBatch()
+
+        future = loop.create_future()
+        state.pending.setdefault(key, []).append(future)
+
+        if len(state.pending) >= self.max_batch_size:
+            self._schedule_flush(state, delay=0)
+        elif state.flush_task is None or state.flush_task.done():
+            self._schedule_flush(state, delay=self.max_delay)
+
+        return await future
+
+    def _schedule_flush(self, state: _LoopBatch[K], delay: float) -> None:
+        """安排一次批量刷新，替换尚未取出批次的延迟刷新"""
+        if state.flush_task is not None:
+            state.flush_task.cancel()
+        state.flush_task = asyncio.create_task(self._flush(state, delay))
+
+    async def _flush(self, state: _LoopBatch[K], delay: float) -> None:
+        """执行批量调用并分发结果"""
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            # 被新的刷新任务替换时批次留给后者处理；否则（如事件循环关闭）取消所有等待方
+            if state.flush_task is asyncio.current_task():
+                state.flush_task = None
+                batch, state.pending = state.pending, {}
+                _cancel_waiters(batch)
+            raise
+
+        # 取出当前批次，之后到达的请求进入下一批；此后的刷新任务不会再被替换取消
+        batch, state.pending = state.pending, {}
+        state.flush_task = None
+
+        try:
+            try:
+                results = await self.batch_fn(list(batch))
+            except Exception as e:
+                for futures in batch.values():
+                    for future in futures:
+                        # 跳过已取消的调用方
+                        if not future.done():
+                            future.set_exception(e)
+                return
+
+            for key, futures in batch.items():
+                result = results.get(key)
+                for future in futures:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # 批量调用被取消或分发中途出错时，不能让剩余等待方永远挂起
+            _cancel_waiters(batch)
+
+
+def _cancel_waiters(batch: Dict[K, List[asyncio.Future]]) -> None:
+    """取消批次中仍未完成的Future"""
+    for futures in batch.values():
+        for future in futures:
+            if not future.done():
+                future.cancel()
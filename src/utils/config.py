@@ -6,12 +6,14 @@
 
 import os
 import json
-from typing import Optional, List, Dict, Any
+import shutil
+import subprocess
+from typing import Optional, List, Dict, Tuple
 from pathlib import Path
-from pydantic import Field, validator
+from pydantic import Field, PrivateAttr, validator
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
-from ..models.api_key import APIKeyConfig, RateLimitPeriod
+from ..models.api_key import APIKeyConfig
 
 # 加载环境变量
 load_dotenv()
@@ -35,6 +37,8 @@ class Config(BaseSettings):
     session_timeout: int = Field(default=1800, env="SESSION_TIMEOUT")  # 30分钟
     max_concurrent_sessions: int = Field(default=100, env="MAX_CONCURRENT_SESSIONS")
     session_cleanup_interval: int = Field(default=300, env="SESSION_CLEANUP_INTERVAL")  # 5分钟
+    max_cached_processes: int = Field(default=50, ge=1, env="MAX_CACHED_PROCESSES")  # 按会话缓存的常驻CLI进程上限
+    process_idle_timeout: int = Field(default=900, env="PROCESS_IDLE_TIMEOUT")  # 15分钟
 
     # 端口配置
     port_range_start: int = Field(default=9000, env="PORT_RANGE_START")
@@ -43,11 +47,28 @@ class Config(BaseSettings):
     # 性能配置
     max_request_size: int = Field(default=10 * 1024 * 1024, env="MAX_REQUEST_SIZE")  # 10MB
     request_timeout: int = Field(default=600, env="REQUEST_TIMEOUT")  # 10分钟
+    stream_batch_size: int = Field(default=1, ge=1, env="STREAM_BATCH_SIZE")  # 每次发送的SSE事件数，1为逐条发送
+
+    # CORS配置（逗号分隔的允许源，未设置时使用本地开发服务器地址）
+    cors_origins: Optional[str] = Field(default=None, env="CORS_ORIGINS")
 
     # API Key配置
     api_keys: List[APIKeyConfig] = Field(default_factory=list, description="API Key配置列表")
     api_key_enabled: bool = Field(default=True, env="API_KEY_ENABLED", description="是否启用API Key验证")
 
+    # Claude CLI验证状态：验证通过时记录可执行文件的修改时间，文件未变化时不再重复检查
+    _claude_verified: bool = PrivateAttr(default=False)
+    _claude_verified_mtime: Optional[float] = PrivateAttr(default=None)
+    _claude_verified_path: Optional[str] = PrivateAttr(default=None)
+
+    # 工作目录解析结果缓存：(原始配置值, 解析后的路径, 路径字符串)，配置值变化时重新解析
+    _working_path_cache: Optional[Tuple[str, Path, str]] = PrivateAttr(default=None)
+
+    # API Key索引缓存：(建立索引时的api_keys列表, key -> 配置)，api_keys被重新赋值时重建
+    _api_key_index: Optional[Tuple[List[APIKeyConfig], Dict[str, APIKeyConfig]]] = PrivateAttr(default=None)
+    # API Key配置版本号，每次重建索引时递增，依赖API Key配置的缓存据此失效
+    _api_key_generation: int = PrivateAttr(default=0)
+
     model_config = {
         "env_file": ".env",
         "env_file_encoding": "utf-8",
@@ -95,30 +116,109 @@ class Config(BaseSettings):
     @property
     def claude_working_path(self) -> Optional[Path]:
         """获取Claude工作目录路径"""
-        if self.claude_working_dir:
-            return Path(self.claude_working_dir).expanduser().resolve()
-        return None
+        cached = self._resolve_working_dir()
+        return cached[1] if cached else None
+
+    @property
+    def claude_working_dir_str(self) -> Optional[str]:
+        """获取解析后的Claude工作目录字符串"""
+        cached = self._resolve_working_dir()
+        return cached[2] if cached else None
+
+    def _resolve_working_dir(self) -> Optional[Tuple[str, Path, str]]:
+        """解析工作目录；CLI启动时才设置claude_working_dir，因此按原始值缓存而不是在初始化时计算"""
+        raw = self.claude_working_dir
+        if not raw:
+            return None
+
+        cached = self._working_path_cache
+        if cached is None or cached[0] != raw:
+            path = Path(raw).expanduser().resolve()
+            cached = self._working_path_cache = (raw, path, str(path))
+        return cached
 
     def validate_claude_setup(self) -> bool:
-        """验证Claude CLI设置"""
+        """验证Claude CLI设置（已验证且可执行文件未变化时直接返回）"""
+        command_path = shutil.which(self.claude_command)
+        if not command_path:
+            self._claude_verified = False
+            return False
+
+        try:
+            mtime = os.stat(command_path).st_mtime
+        except OSError:
+            self._claude_verified = False
+            return False
+
+        if (
+            self._claude_verified
+            and command_path == self._claude_verified_path
+            and mtime == self._claude_verified_mtime
+        ):
+            return True
+
         try:
-            import subprocess
             result = subprocess.run(
-                [self.claude_command, "--version"],
+                [command_path, "--version"],
                 capture_output=True,
                 text=True,
                 timeout=10
             )
-            return result.returncode == 0
+            verified = result.returncode == 0
         except (subprocess.TimeoutExpired, FileNotFoundError):
+            verified = False
+
+        if verified:
+            self.mark_claude_verified(command_path, mtime)
+        else:
+            self._claude_verified = False
+        return verified
+
+    def is_claude_verified(self, command_path: str) -> bool:
+        """检查指定路径的Claude CLI是否已验证通过且可执行文件未变化（只需一次stat）"""
+        if not self._claude_verified or command_path != self._claude_verified_path:
+            return False
+        try:
+            return os.stat(command_path).st_mtime == self._claude_verified_mtime
+        except OSError:
             return False
 
+    def mark_claude_verified(self, command_path: str, mtime: Optional[float] = None) -> None:
+        """记录Claude CLI已验证通过"""
+        if mtime is None:
+            try:
+                mtime = os.stat(command_path).st_mtime
+            except OSError:
+                return
+        self._claude_verified = True
+        self._claude_verified_mtime = mtime
+        self._claude_verified_path = command_path
+
     def get_api_key_config(self, api_key: str) -> Optional[APIKeyConfig]:
-        """根据API Key获取配置"""
-        for key_config in self.api_keys:
-            if key_config.key == api_key:
-                return key_config
-        return None
+        """根据API Key获取配置（通过字典索引查找）"""
+        index = self._api_key_index
+        if index is None or index[0] is not self.api_keys:
+            index = self.reload_api_key_index()
+        return index[1].get(api_key)
+
+    @property
+    def api_key_generation(self) -> int:
+        """API Key配置版本号，api_keys被重新赋值或手动重建索引后变化"""
+        index = self._api_key_index
+        if index is None or index[0] is not self.api_keys:
+            self.reload_api_key_index()
+        return self._api_key_generation
+
+    def reload_api_key_index(self) -> Tuple[List[APIKeyConfig], Dict[str, APIKeyConfig]]:
+        """重建API Key索引，原地修改api_keys列表后需手动调用"""
+        api_keys = self.api_keys
+        # 与原先的线性查找一致，重复的Key以第一个配置为准
+        by_key: Dict[str, APIKeyConfig] = {}
+        for key_config in api_keys:
+            by_key.setdefault(key_config.key, key_config)
+        self._api_key_index = (api_keys, by_key)
+        self._api_key_generation += 1
+        return self._api_key_index
 
     def is_valid_api_key(self, api_key: str) -> bool:
         """检查API Key是否有效"""
@@ -0,0 +1,27 @@
+"""
+API Key统计接口测试
+"""
+
+from fastapi.testclient import TestClient
+
+from src.api.main import app
+from src.models.api_key import APIKeyConfig
+from src.utils.config import config
+
+
+def test_stats_polling_returns_not_modified(monkeypatch):
+    """连续轮询统计接口时，第二次请求携带ETag应返回304"""
+    monkeypatch.setattr(config, "api_keys", [
+        APIKeyConfig(key="sk-stats-poll-test", max_requests=100, period="day")
+    ])
+    client = TestClient(app)
+    headers = {"Authorization": "Bearer sk-stats-poll-test"}
+
+    first = client.get("/v1/api-key/stats", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    for _ in range(2):
+        response = client.get("/v1/api-key/stats", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag